@@ -33,6 +33,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "users",
     "lots",
     'django_cleanup.apps.CleanupConfig',
@@ -72,9 +73,13 @@ TEMPLATES = [
     },
 ]
 
-# Pillow large images guard off
+# лимиты на исходники изображений: проверяются по заголовку до декодирования
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS") or 120_000_000)
+IMAGE_MAX_DECODE_MB = int(os.getenv("IMAGE_MAX_DECODE_MB") or 512)
+
+# встроенная защита Pillow от decompression bomb срабатывает на тех же лимитах
 from PIL import Image
-Image.MAX_IMAGE_PIXELS = None
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
 
 WSGI_APPLICATION = "config.wsgi.application"
 
@@ -108,6 +113,13 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# миниатюры по запросу (/img/...): собираются один раз и лежат в отдельном кэше,
+# в проде файл отдаёт nginx через X-Accel-Redirect на внутренний location
+THUMBNAIL_CACHE_ROOT = os.getenv("THUMBNAIL_CACHE_ROOT") or os.path.join(BASE_DIR, "thumbnail_cache")
+THUMBNAIL_CACHE_URL = "/_thumbnails/"
+THUMBNAIL_CACHE_MAX_MB = int(os.getenv("THUMBNAIL_CACHE_MAX_MB") or 1024)
+THUMBNAIL_ACCEL_REDIRECT = not DEBUG
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.User"
@@ -125,4 +137,26 @@ TG_ADMIN_GROUP_ID = int(os.getenv("TG_ADMIN_GROUP_ID", 0))
 
 REDIS_URL = os.getenv("REDIS_URL")
 
+# кэш страниц каталога и фасетов; без Redis (локальная разработка) — в памяти процесса
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "cache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# фоновая обработка изображений (manage.py run_rendition_worker)
+RENDITION_WORKER_PROCESSES = int(os.getenv("RENDITION_WORKER_PROCESSES") or 2)
+
+# файлы импорта из админки ждут воркера здесь: каталог общий для web и worker, но не публичный, как media
+IMPORT_STAGING_ROOT = os.getenv("IMPORT_STAGING_ROOT") or os.path.join(BASE_DIR, "import_staging")
+
 register_heif_opener()
\ No newline at end of file
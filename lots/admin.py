@@ -1,7 +1,19 @@
 from django.contrib import admin
+from django.contrib.postgres.fields import ArrayField
+from django.core.exceptions import PermissionDenied
+from django.db.models.functions import Length
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
 from django.urls import path
-from django.http import JsonResponse
-from .models import Lot, LotImage
+from django.http import Http404, JsonResponse
+from . import taxonomy
+from .facets import price_histogram
+from .feeds import EXPORT_FORMATS
+from .forms import LotImportForm, TagsField
+from .importer import import_status, stage_import
+from .models import Lot, LotImage, Tag
+from .tasks import batched_renditions
+from .templatetags.price import price
 
 
 class LotImageInline(admin.TabularInline):
@@ -9,17 +21,73 @@ class LotImageInline(admin.TabularInline):
     extra = 3
 
 
+class PriceRangeFilter(admin.SimpleListFilter):
+    """Диапазоны цены по квантилям каталога вместо ссылки на каждую встречающуюся цену"""
+    title = "Цена"
+    parameter_name = "price_range"
+
+    def lookups(self, request, model_admin):
+        result = []
+        for low, high in price_histogram(model_admin.get_queryset(request)):
+            if low is None:
+                label = f"до {price(high)} ₽"
+            elif high is None:
+                label = f"от {price(low)} ₽"
+            else:
+                label = f"{price(low)} – {price(high)} ₽"
+            result.append((f"{low or ''}-{high or ''}", label))
+        return result
+
+    def queryset(self, request, queryset):
+        # нижняя граница включается, верхняя нет: диапазоны не пересекаются
+        low, _, high = (self.value() or "").partition("-")
+        if low.isdigit():
+            queryset = queryset.filter(price__gte=int(low))
+        if high.isdigit():
+            queryset = queryset.filter(price__lt=int(high))
+        return queryset
+
+
 @admin.register(Lot)
 class LotAdmin(admin.ModelAdmin):
     list_display = ("title", "price", "category", "is_active", "created_at", "image_preview")
     inlines = [LotImageInline]
-    list_filter = ("is_active", "category", "price")
-    search_fields = ("title", "description", "tags")
+    list_filter = ("is_active", "category", PriceRangeFilter)
+    search_fields = ("title", "description", "=external_sku")
     readonly_fields = ("image_preview",)
     fields = (
-    "title", "price", "description", "main_image", "image_preview", "category", "tags", "is_active", "created_at",
-    "updated_at")
+    "title", "price", "description", "main_image", "image_preview", "category", "tags", "is_active", "external_sku",
+    "created_at", "updated_at")
     readonly_fields = ("created_at", "updated_at", "image_preview")
+    formfield_overrides = {
+        ArrayField: {"form_class": TagsField},
+    }
+    actions = ["activate", "deactivate"]
+
+    @admin.action(description="Опубликовать выбранные лоты")
+    def activate(self, request, queryset):
+        count = taxonomy.set_active(queryset, True)
+        self.message_user(request, f"Опубликовано лотов: {count}")
+
+    @admin.action(description="Снять с публикации выбранные лоты")
+    def deactivate(self, request, queryset):
+        count = taxonomy.set_active(queryset, False)
+        self.message_user(request, f"Снято с публикации лотов: {count}")
+
+    def changeform_view(self, request, *args, **kwargs):
+        # главное фото и все новые фото галереи обрабатываются одной пачкой, а не по очереди
+        with batched_renditions():
+            return super().changeform_view(request, *args, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        # точное совпадение тега через GIN-индекс lot_tags_gin; строится от пришедшего queryset,
+        # чтобы фильтры справа (публикация, категория, цена) действовали и на него
+        term = search_term.strip().lower()
+        tagged = queryset.filter(tags__contains=[term]) if term else None
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if tagged is not None:
+            queryset |= tagged
+        return queryset, may_have_duplicates
 
     def get_urls(self):
         urls = super().get_urls()
@@ -29,9 +97,57 @@ class LotAdmin(admin.ModelAdmin):
         custom_urls = [
             path('tag-suggestions/', self.admin_site.admin_view(self.tag_suggestions_view),
                  name='%s_%s_tag_suggestions' % (self.model._meta.app_label, self.model._meta.model_name)),
+            path('export/<str:fmt>/', self.admin_site.admin_view(self.export_view),
+                 name='%s_%s_export' % (self.model._meta.app_label, self.model._meta.model_name)),
+            path('import/', self.admin_site.admin_view(self.import_view),
+                 name='%s_%s_import' % (self.model._meta.app_label, self.model._meta.model_name)),
+            path('import/<str:import_id>/', self.admin_site.admin_view(self.import_status_view),
+                 name='%s_%s_import_status' % (self.model._meta.app_label, self.model._meta.model_name)),
         ]
         return custom_urls + urls
 
+    def export_view(self, request, fmt):
+        # весь каталог потоком, память не зависит от числа лотов
+        if fmt not in EXPORT_FORMATS or not self.has_view_permission(request):
+            raise Http404
+        return EXPORT_FORMATS[fmt]().response()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+
+        form = LotImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            # импорт идёт в фоновом воркере: запрос только сохраняет файлы
+            data = form.cleaned_data
+            import_id = stage_import(data["manifest"], data["photos"], data["dry_run"])
+            return redirect("admin:lots_lot_import_status", import_id)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Импорт лотов",
+            "form": form,
+        }
+        return TemplateResponse(request, "admin/lots/lot/import.html", context)
+
+    def import_status_view(self, request, import_id):
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+
+        status = import_status(import_id)
+        if status is None:
+            raise Http404("Импорт не найден")
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Импорт лотов",
+            "status": status,
+            "finished": status["state"] in ("done", "failed"),
+        }
+        return TemplateResponse(request, "admin/lots/lot/import_status.html", context)
+
     def tag_suggestions_view(self, request):
         query = request.GET.get("q", "").strip().lower()
         input_text = request.GET.get("input", "").strip()
@@ -45,17 +161,11 @@ class LotAdmin(admin.ModelAdmin):
         if len(query) < 1:
             return JsonResponse([], safe=False)
 
-        all_tags = set()
-
-        for lot in Lot.objects.exclude(tags__isnull=True).exclude(tags="").only("tags"):
-            for tag in lot.tags.split(","):
-                tag = tag.strip()
-                if tag:
-                    all_tags.add(tag)
-
+        # словарь тегов: ILIKE обслуживается триграммным индексом tag_name_trgm
+        entered = {p.lower() for p in parts[:-1]}
         suggestions = [
-            t for t in all_tags
-            if query in t.lower() and t.lower() not in [p.lower() for p in parts[:-1]]
+            t for t in Tag.objects.filter(name__icontains=query).order_by(Length("name")).values_list("name", flat=True)[:50]
+            if t not in entered
         ]
 
         suggestions.sort(key=lambda x: (
@@ -0,0 +1,195 @@
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+
+from .caching import render_cards
+from .models import ImageStatus, Lot, LotImage
+from .pagination import KEYSET_ORDERINGS
+from .views import LotDetailView, LotListView
+
+# поле ответа -> столбцы, которые нужны для него из БД
+FIELDS = {
+    "id": ("id",),
+    "title": ("title",),
+    "description": ("description",),
+    "price": ("price",),
+    "category": ("category",),
+    "tags": ("tags",),
+    "created_at": ("created_at",),
+    "updated_at": ("updated_at",),
+    "url": ("id",),
+    "image": ("main_image", "preview_image", "renditions", "image_width", "image_height", "image_color",
+              "image_status"),
+    # фото галереи и HTML карточки догружаются отдельным запросом на всю страницу
+    "images": ("id",),
+    "card": ("id",),
+}
+DEFAULT_FIELDS = ("id", "title", "price", "category", "tags", "created_at", "url", "image")
+DETAIL_FIELDS = (*DEFAULT_FIELDS, "description", "updated_at", "images")
+IMAGE_COLUMNS = ("id", "lot_id", "image", "preview_image", "renditions", "image_width", "image_height",
+                 "image_color", "image_status")
+MAX_LIMIT = 100
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def parse_fields(request, default):
+    """?fields=id,title,image — только нужные поля; неизвестное поле — ошибка, а не молчаливый пропуск"""
+    raw = request.GET.get("fields", "")
+    fields = [f.strip() for f in raw.split(",") if f.strip()] or list(default)
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        raise FieldsError(f"Неизвестные поля: {', '.join(unknown)}")
+    return fields
+
+
+def columns_for(fields, *extra):
+    columns = {"id", *extra}
+    for field in fields:
+        columns.update(FIELDS[field])
+    return sorted(columns)
+
+
+def image_data(row, source_field, storage):
+    """Фото из строки values(): превью, оригинал и версии по форматам — как в {% picture %}"""
+    name = row[source_field]
+    if not name or row["image_status"] == ImageStatus.PENDING:
+        return None
+
+    sources = {}
+    for item in sorted(row["renditions"] or [], key=lambda i: i["width"]):
+        sources.setdefault(item["format"], []).append({"url": storage.url(item["name"]), "width": item["width"]})
+    return {
+        "url": storage.url(row["preview_image"] or name),
+        "original": storage.url(name),
+        "width": row["image_width"],
+        "height": row["image_height"],
+        "color": row["image_color"],
+        "sources": sources,
+    }
+
+
+def gallery(lot_ids):
+    """
+    Фото галереи для всех лотов страницы одним запросом по индексу lot_id —
+    то же, что prefetch_related("images"), но без экземпляров моделей
+    """
+    storage = LotImage._meta.get_field("image").storage
+    result = {pk: [] for pk in lot_ids}
+    rows = LotImage.objects.filter(lot_id__in=lot_ids).order_by("pk").values(*IMAGE_COLUMNS)
+    for row in rows:
+        data = image_data(row, "image", storage)
+        if data:
+            result[row["lot_id"]].append(data)
+    return result
+
+
+def cards(lot_ids):
+    # карточки — из того же кэша фрагментов, что и HTML-список
+    lots = Lot.objects.filter(pk__in=lot_ids).defer("search_vector").in_bulk()
+    present = [pk for pk in lot_ids if pk in lots]
+    return dict(zip(present, render_cards([lots[pk] for pk in present])))
+
+
+def serialize(rows, fields):
+    """Строки values() -> JSON; запросов не больше двух на страницу, сколько бы лотов в ней ни было"""
+    storage = Lot._meta.get_field("main_image").storage
+    ids = [row["id"] for row in rows]
+    images = gallery(ids) if "images" in fields else {}
+    html = cards(ids) if "card" in fields else {}
+
+    result = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            if field == "url":
+                item[field] = reverse("lots:lot_detail", args=[row["id"]])
+            elif field == "image":
+                item[field] = image_data(row, "main_image", storage)
+            elif field == "images":
+                item[field] = images[row["id"]]
+            elif field == "card":
+                item[field] = html.get(row["id"], "")
+            else:
+                item[field] = row[field]
+        result.append(item)
+    return result
+
+
+def error(message, status=400):
+    return JsonResponse({"error": message}, status=status, json_dumps_params={"ensure_ascii": False})
+
+
+class LotListApiView(LotListView):
+    """
+    GET /api/lots/ — те же фильтры, сортировки и постраничный вывод, что у списка лотов
+    (q, tag, any_tag, category, min_price, max_price, sort, cursor/page), плюс
+    fields= и limit=. Ссылки next/previous готовы к использованию как есть
+    """
+
+    def get_paginate_by(self, queryset):
+        try:
+            limit = int(self.request.GET.get("limit", ""))
+        except ValueError:
+            return self.paginate_by
+        return max(1, min(limit, MAX_LIMIT))
+
+    def get_queryset(self, fuzzy=False):
+        # словари вместо экземпляров; ключ сортировки нужен для курсора
+        sort_field = KEYSET_ORDERINGS.get(self.get_sort(), ("id",))[0]
+        return super().get_queryset(fuzzy).values(*columns_for(self.fields, sort_field))
+
+    def get(self, request, *args, **kwargs):
+        try:
+            self.fields = parse_fields(request, DEFAULT_FIELDS)
+        except FieldsError as e:
+            return error(str(e))
+
+        self.object_list = self.get_queryset()
+        _, page, rows, _ = self.paginate_queryset(self.object_list, self.get_paginate_by(self.object_list))
+        return JsonResponse(
+            {
+                "results": serialize(list(rows), self.fields),
+                "next": self.page_url(page, "next"),
+                "previous": self.page_url(page, "previous"),
+                "fuzzy": self.fuzzy,
+                "suggestion": self.suggestion,
+            },
+            json_dumps_params={"ensure_ascii": False},
+        )
+
+    def page_url(self, page, direction):
+        params = self.request.GET.copy()
+        params.pop("cursor", None)
+        params.pop("page", None)
+        if self.fuzzy:
+            params["fuzzy"] = "1"
+        cursor = getattr(page, f"{direction}_cursor", None)
+        if cursor:
+            params["cursor"] = cursor
+        elif getattr(page, f"has_{direction}")() and hasattr(page, "number"):
+            params["page"] = getattr(page, f"{direction}_page_number")()
+        else:
+            return None
+        return f"{self.request.path}?{params.urlencode()}"
+
+
+class LotDetailApiView(LotDetailView):
+    """GET /api/lots/<id>/ — лот с галереей; fields= как у списка"""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            fields = parse_fields(request, DETAIL_FIELDS)
+        except FieldsError as e:
+            return error(str(e))
+
+        row = (
+            self.get_queryset().prefetch_related(None)
+            .filter(pk=kwargs["pk"])
+            .values(*columns_for(fields))
+            .first()
+        )
+        if row is None:
+            raise Http404
+        return JsonResponse(serialize([row], fields)[0], json_dumps_params={"ensure_ascii": False})
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LotsConfig(AppConfig):
     name = "lots"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import time
+from functools import cache as memoize
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# номер версии каталога: входит в ключи всех кэшированных страниц и фасетов,
+# поэтому после изменения лота старые записи просто перестают читаться
+VERSION_KEY = "lots:catalogue-version"
+# время последнего сброса версии — Last-Modified страниц списка
+MODIFIED_KEY = "lots:catalogue-modified"
+PAGE_TIMEOUT = 60 * 60
+CARD_TEMPLATE = "lots/_lot_card.html"
+CARD_TIMEOUT = 24 * 60 * 60
+
+
+def catalogue_version():
+    """Текущая версия каталога или None, если кэш недоступен — тогда страницы собираются без него"""
+    try:
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # начальное значение от времени: если ключ пропал из Redis, версия не вернётся к старой
+            cache.add(VERSION_KEY, time.time_ns(), None)
+            cache.add(MODIFIED_KEY, timezone.now(), None)
+            version = cache.get(VERSION_KEY)
+    except RedisError as e:
+        logger.warning("Кэш недоступен (%s), страницы каталога собираются без него", e)
+        return None
+    return version
+
+
+def catalogue_modified():
+    # catalogue_version() заодно заводит оба ключа, если их ещё нет
+    if catalogue_version() is None:
+        return None
+    try:
+        return cache.get(MODIFIED_KEY)
+    except RedisError:
+        return None
+
+
+def bump_version():
+    try:
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, time.time_ns(), None)
+        cache.set(MODIFIED_KEY, timezone.now(), None)
+    except RedisError:
+        logger.exception("Не удалось сбросить кэш каталога")
+
+
+def bump_catalogue_version():
+    """
+    Сбрасывает кэш страниц каталога после коммита: до коммита параллельный запрос
+    успел бы закэшировать старые данные уже под новой версией
+    """
+    transaction.on_commit(bump_version)
+
+
+def normalized_query(request):
+    # порядок параметров и пустые значения не меняют страницу
+    return sorted((key, values) for key, values in request.GET.lists() if any(values))
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified до какой-либо работы с шаблонами: совпадение с If-None-Match /
+    If-Modified-Since отдаёт 304 без тела. Браузер хранит копию, но перепроверяет её
+    при каждом открытии (no-cache), поэтому правка лота видна сразу
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        return None
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        view = condition(etag_func=self.get_etag, last_modified_func=self.get_last_modified)(super().dispatch)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+class CatalogueCacheMixin:
+    """
+    Готовый HTML страниц каталога для анонимных посетителей, ключ — версия каталога,
+    путь и нормализованные GET-параметры. Авторизованным страница собирается заново
+    """
+    page_timeout = PAGE_TIMEOUT
+
+    def get_page_cache_key(self, request, version):
+        raw = f"{request.path}?{normalized_query(request)}"
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        return f"lots:page:{version}:{type(self).__name__}:{digest}"
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != "GET" or request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        # версия читается до запросов к БД: страница с уже новыми данными под старой версией безвредна
+        version = catalogue_version()
+        if version is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self.get_page_cache_key(request, version)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            if hasattr(response, "render"):
+                response.render()
+            cache.set(key, (response.content, response["Content-Type"]), self.page_timeout)
+        return response
+
+
+@memoize
+def template_digest(template_name):
+    # правка шаблона после деплоя меняет ключи, старые фрагменты не используются
+    return hashlib.md5(get_template(template_name).template.source.encode()).hexdigest()[:8]
+
+
+def card_key(lot):
+    return f"lots:card:{template_digest(CARD_TEMPLATE)}:{lot.pk}:{lot.updated_at.timestamp()}"
+
+
+def render_cards(lots):
+    """
+    HTML карточек лотов в исходном порядке. Фрагмент зависит только от лота (его updated_at
+    меняется при любом сохранении и обработке фото), поэтому переживает сброс версии каталога
+    и работает на страницах, которые целиком не кэшируются (редкие поисковые запросы).
+    Все фрагменты страницы читаются одним MGET, отрисовываются только промахи
+    """
+    keys = [card_key(lot) for lot in lots]
+    try:
+        cached = cache.get_many(keys)
+    except RedisError:
+        cached = {}
+
+    missing = {}
+    cards = []
+    for key, lot in zip(keys, lots):
+        html = cached.get(key)
+        if html is None:
+            html = missing[key] = render_to_string(CARD_TEMPLATE, {"lot": lot})
+        cards.append(mark_safe(html))
+
+    if missing:
+        try:
+            cache.set_many(missing, CARD_TIMEOUT)
+        except RedisError:
+            pass
+    return cards
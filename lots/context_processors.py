@@ -1,29 +1,17 @@
-from collections import Counter
-from .models import Lot
+from django.utils.functional import SimpleLazyObject
+from .models import Category, Tag
 
-def categories_processor(request):
-    lots = Lot.objects.filter(is_active=True)
-
-    # категории + частота
-    categories_counter = Counter(
-        lots.exclude(category__isnull=True)
-             .exclude(category__exact="")
-             .values_list("category", flat=True)
-    )
-
-    categories = [c for c, _ in categories_counter.most_common()]
-
-    # теги + частота
-    tags_counter = Counter()
-    for tags in lots.exclude(tags="").values_list("tags", flat=True):
-        for t in [x.strip() for x in tags.split(",") if x.strip()]:
-            tags_counter[t] += 1
-
-    tags = [t for t, _ in tags_counter.most_common()]
 
+def categories_processor(request):
+    # меню берётся из готовых счётчиков (lots.taxonomy) и запрашивается,
+    # только если шаблон действительно обращается к site_categories / site_tags
     return {
-        "site_categories": categories,
-        "site_tags": tags,
+        "site_categories": SimpleLazyObject(
+            lambda: list(Category.objects.filter(lot_count__gt=0).values_list("name", flat=True))
+        ),
+        "site_tags": SimpleLazyObject(
+            lambda: list(Tag.objects.filter(lot_count__gt=0).order_by("-lot_count", "name").values_list("name", flat=True))
+        ),
     }
 
 def search_form_processor(request):
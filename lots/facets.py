@@ -0,0 +1,177 @@
+import bisect
+import hashlib
+import json
+
+from django.contrib.postgres.fields import ArrayField
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Aggregate, IntegerField
+
+from .caching import catalogue_version
+from .models import Category, PriceBucket, Tag
+
+# границы ценовых диапазонов, ₽: width_bucket относит цену к диапазону 0..len(PRICE_BOUNDS)
+PRICE_BOUNDS = [1_000, 5_000, 10_000, 50_000, 100_000, 500_000]
+TAG_LIMIT = 30
+# фасеты широкого фильтра считаются по первым строкам выдачи: работа на страницу ограничена
+FACET_SCAN_LIMIT = 1000
+CACHE_TIMEOUT = 300
+HISTOGRAM_CACHE_KEY = "lots:price-histogram"
+HISTOGRAM_TIMEOUT = 60 * 60
+
+
+def normalize_filter(q="", tags=(), any_tags=(), category="", min_price=None, max_price=None):
+    """Один и тот же набор лотов при любом порядке и регистре параметров — один ключ кэша"""
+    return {
+        "q": " ".join(q.lower().split()),
+        "tags": sorted(set(tags)),
+        "any_tags": sorted(set(any_tags)),
+        "category": category.strip().lower(),
+        "min_price": min_price,
+        "max_price": max_price,
+    }
+
+
+def cache_key(filters):
+    digest = hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    return f"lots:facets:{digest}"
+
+
+def is_unfiltered(filters):
+    return not (filters["q"] or filters["tags"] or filters["any_tags"] or filters["category"]) \
+        and filters["min_price"] is None and filters["max_price"] is None
+
+
+def price_bucket(price):
+    """Номер ценового диапазона — то же, что width_bucket(price, PRICE_BOUNDS) в SQL"""
+    return bisect.bisect_right(PRICE_BOUNDS, price)
+
+
+def price_range(bucket):
+    """(от, до включительно) для номера диапазона; None — без границы"""
+    low = PRICE_BOUNDS[bucket - 1] if bucket > 0 else None
+    high = PRICE_BOUNDS[bucket] - 1 if bucket < len(PRICE_BOUNDS) else None
+    return low, high
+
+
+def facet_counts(queryset):
+    """
+    Число лотов по категориям, тегам и ценовым диапазонам для отфильтрованного набора —
+    один запрос: выборка читается один раз (CTE), три группировки склеиваются UNION ALL.
+    Выборка берётся в порядке списка (по тому же индексу) и не длиннее FACET_SCAN_LIMIT;
+    если набор длиннее, счётчики — нижние границы (approximate), а варианты, не попавшие
+    в выборку, добавляются из счётчиков каталога без числа (None)
+    """
+    rows = queryset.values("category", "tags", "price")[:FACET_SCAN_LIMIT]
+    sql, params = rows.query.sql_with_params()
+    query = f"""
+        WITH filtered AS MATERIALIZED ({sql})
+        (SELECT 'total', NULL, count(*) FROM filtered)
+        UNION ALL
+        (SELECT 'category', category, count(*) FROM filtered WHERE category <> '' GROUP BY category)
+        UNION ALL
+        (SELECT 'tag', tag, count(*) FROM filtered, unnest(tags) AS tag
+         GROUP BY tag ORDER BY count(*) DESC, tag LIMIT %s)
+        UNION ALL
+        (SELECT 'price', width_bucket(price, %s::integer[])::text, count(*) FROM filtered GROUP BY 2)
+    """
+    facets = {"categories": [], "tags": [], "prices": [], "approximate": False}
+    with connection.cursor() as cursor:
+        cursor.execute(query, [*params, TAG_LIMIT, PRICE_BOUNDS])
+        rows = cursor.fetchall()
+
+    for facet, value, count in rows:
+        if facet == "total":
+            facets["approximate"] = count >= FACET_SCAN_LIMIT
+        elif facet == "category":
+            facets["categories"].append((value, count))
+        elif facet == "tag":
+            facets["tags"].append((value, count))
+        else:
+            facets["prices"].append((*price_range(int(value)), count))
+
+    facets["categories"].sort(key=lambda item: (-item[1], item[0]))
+    facets["prices"].sort(key=lambda item: item[0] or 0)
+    if facets["approximate"]:
+        add_missing_options(facets, catalogue_facets())
+    return facets
+
+
+def add_missing_options(facets, catalogue):
+    """Варианты из счётчиков каталога, которых нет среди посчитанных, — в конец списка, без числа"""
+    for name in ("categories", "tags"):
+        seen = {value for value, _ in facets[name]}
+        facets[name] += [(value, None) for value, _ in catalogue[name] if value not in seen]
+    facets["tags"] = facets["tags"][:TAG_LIMIT]
+
+    seen = {(low, high) for low, high, _ in facets["prices"]}
+    facets["prices"] += [(low, high, None) for low, high, _ in catalogue["prices"] if (low, high) not in seen]
+    facets["prices"].sort(key=lambda item: item[0] or 0)
+
+
+def catalogue_facets():
+    """
+    Фасеты всего каталога — из счётчиков, которые lots.taxonomy поддерживает при каждом изменении лота:
+    три запроса к маленьким таблицам, сколько бы лотов ни было
+    """
+    categories = Category.objects.filter(lot_count__gt=0).order_by("-lot_count", "name")
+    tags = Tag.objects.filter(lot_count__gt=0).order_by("-lot_count", "name")[:TAG_LIMIT]
+    buckets = PriceBucket.objects.filter(lot_count__gt=0).order_by("bucket")
+    return {
+        "categories": list(categories.values_list("name", "lot_count")),
+        "tags": list(tags.values_list("name", "lot_count")),
+        "prices": [(*price_range(bucket), count) for bucket, count in buckets.values_list("bucket", "lot_count")],
+        "approximate": False,
+    }
+
+
+def get_facets(queryset, filters):
+    """Счётчики для набора, заданного filters; пагинация и сортировка на них не влияют"""
+    if is_unfiltered(filters):
+        return catalogue_facets()
+
+    # отфильтрованный набор считается одним запросом по выборке и кэшируется до изменения каталога
+    version = catalogue_version()
+    if version is None:
+        return facet_counts(queryset)
+
+    key = cache_key({**filters, "version": version})
+    facets = cache.get(key)
+    if facets is None:
+        facets = facet_counts(queryset)
+        cache.set(key, facets, CACHE_TIMEOUT)
+    return facets
+
+
+class PercentileDisc(Aggregate):
+    """percentile_disc(ARRAY[...]) WITHIN GROUP (ORDER BY поле): все квантили одним проходом"""
+    function = "percentile_disc"
+    template = "%(function)s(%(fractions)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+    def __init__(self, expression, fractions, **extra):
+        fractions = "ARRAY[%s]" % ", ".join(str(float(f)) for f in fractions)
+        super().__init__(expression, fractions=fractions, output_field=ArrayField(IntegerField()), **extra)
+
+
+def nice(value):
+    """Граница диапазона, округлённая до двух значащих цифр: 13 742 -> 14 000"""
+    if value < 100:
+        return value
+    step = 10 ** (len(str(value)) - 2)
+    return round(value / step) * step
+
+
+def price_histogram(queryset, buckets=5):
+    """
+    Границы ценовых диапазонов с примерно равным числом лотов в каждом (квантили цены).
+    Распределение меняется медленно, поэтому границы кэшируются на час
+    """
+    bounds = cache.get(HISTOGRAM_CACHE_KEY)
+    if bounds is None:
+        fractions = [i / buckets for i in range(1, buckets)]
+        quantiles = queryset.aggregate(q=PercentileDisc("price", fractions))["q"] or []
+        bounds = sorted({nice(v) for v in quantiles if v})
+        cache.set(HISTOGRAM_CACHE_KEY, bounds, HISTOGRAM_TIMEOUT)
+
+    edges = [None, *bounds, None]
+    return list(zip(edges, edges[1:]))
@@ -0,0 +1,289 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import batched
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.views import View
+from redis.exceptions import RedisError
+
+from .caching import ConditionalGetMixin, catalogue_version
+from .models import Category, Lot
+
+# протокол sitemaps: не больше 50 000 адресов в одном файле, один из них — главная страница
+SITEMAP_LIMIT = 50_000
+LOTS_PER_SITEMAP = SITEMAP_LIMIT - 1
+CHUNK_ROWS = 2000
+CHUNK_TIMEOUT = 6 * 60 * 60
+YML_DESCRIPTION_LIMIT = 3000
+
+
+def absolute(url):
+    return url if url.startswith(("http://", "https://")) else settings.SITE_URL.rstrip("/") + url
+
+
+class Feed:
+    """
+    Выгрузка каталога потоком: строки читаются из БД курсором пачками по CHUNK_ROWS
+    (values_list, без экземпляров моделей), каждая пачка превращается в текст и сразу отдаётся.
+    Готовые пачки кэшируются по версии каталога, в памяти одновременно только одна пачка
+    """
+    content_type = "text/plain; charset=utf-8"
+    filename = None
+    # первый столбец — pk: по нему пачка пересобирается, если её вытеснили из кэша
+    columns = ("pk",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def queryset(self):
+        return Lot.objects.filter(is_active=True).order_by("pk")
+
+    def rows(self):
+        return self.queryset()
+
+    def header(self):
+        return ""
+
+    def footer(self):
+        return ""
+
+    def render(self, rows):
+        raise NotImplementedError
+
+    def chunks(self):
+        version = catalogue_version()
+        batches = batched(self.rows().values_list(*self.columns).iterator(chunk_size=CHUNK_ROWS), CHUNK_ROWS)
+        if version is None:
+            for rows in batches:
+                yield self.render(rows)
+            return
+
+        index_key = f"lots:feed:{self.key}:{version}"
+        try:
+            index = cache.get(index_key)
+        except RedisError:
+            index = None
+
+        if index is None:
+            # первая выгрузка этой версии: собираем из БД, запоминая границы пачек по pk
+            index = []
+            for rows in batches:
+                text = self.render(rows)
+                self.store(f"{index_key}:{len(index)}", text)
+                index.append((rows[0][0], rows[-1][0]))
+                yield text
+            self.store(index_key, index)
+            return
+
+        for number, (first, last) in enumerate(index):
+            try:
+                text = cache.get(f"{index_key}:{number}")
+            except RedisError:
+                text = None
+            if text is None:
+                rows = self.queryset().filter(pk__range=(first, last)).values_list(*self.columns)
+                text = self.render(list(rows))
+                self.store(f"{index_key}:{number}", text)
+            yield text
+
+    def store(self, key, value):
+        try:
+            cache.set(key, value, CHUNK_TIMEOUT)
+        except RedisError:
+            pass
+
+    def stream(self):
+        yield self.header()
+        yield from self.chunks()
+        yield self.footer()
+
+    def response(self):
+        response = StreamingHttpResponse(self.stream(), content_type=self.content_type)
+        if self.filename:
+            response["Content-Disposition"] = f'attachment; filename="{self.filename}"'
+        return response
+
+
+class SitemapFeed(Feed):
+    content_type = "application/xml; charset=utf-8"
+    columns = ("pk", "updated_at")
+
+    def __init__(self, page=0):
+        super().__init__(f"sitemap-{page}")
+        self.page = page
+
+    def rows(self):
+        start = self.page * LOTS_PER_SITEMAP
+        return self.queryset()[start:start + LOTS_PER_SITEMAP]
+
+    def header(self):
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            f"<url><loc>{escape(absolute(reverse('lots:lot_list')))}</loc></url>\n"
+        )
+
+    def footer(self):
+        return "</urlset>\n"
+
+    def render(self, rows):
+        return "".join(
+            f"<url><loc>{escape(absolute(reverse('lots:lot_detail', args=[pk])))}</loc>"
+            f"<lastmod>{updated_at.date().isoformat()}</lastmod></url>\n"
+            for pk, updated_at in rows
+        )
+
+
+def sitemap_index(pages):
+    urls = "".join(
+        f"<sitemap><loc>{escape(absolute(reverse('lots:sitemap_page', args=[page])))}</loc></sitemap>\n"
+        for page in range(1, pages + 1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        f"{urls}</sitemapindex>\n"
+    )
+
+
+class YmlFeed(Feed):
+    """Товарный фид в формате YML (Яндекс); Google Merchant Center принимает его же"""
+    content_type = "application/xml; charset=utf-8"
+    columns = ("pk", "title", "price", "category", "description", "main_image")
+
+    def __init__(self):
+        super().__init__("yml")
+        # категорий немного: словарь целиком в памяти
+        self.categories = dict(Category.objects.filter(lot_count__gt=0).values_list("name", "pk"))
+        self.storage = Lot._meta.get_field("main_image").storage
+
+    def header(self):
+        categories = "".join(
+            f"<category id=\"{pk}\">{escape(name)}</category>\n" for name, pk in self.categories.items()
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f"<yml_catalog date={quoteattr(timezone.localtime().strftime('%Y-%m-%dT%H:%M'))}>\n<shop>\n"
+            "<name>Магия старины</name>\n<company>Магия старины</company>\n"
+            f"<url>{escape(absolute('/'))}</url>\n"
+            '<currencies><currency id="RUR" rate="1"/></currencies>\n'
+            f"<categories>\n{categories}</categories>\n<offers>\n"
+        )
+
+    def footer(self):
+        return "</offers>\n</shop>\n</yml_catalog>\n"
+
+    def render(self, rows):
+        parts = []
+        for pk, title, price, category, description, image in rows:
+            parts.append(f'<offer id="{pk}" available="true">')
+            parts.append(f"<url>{escape(absolute(reverse('lots:lot_detail', args=[pk])))}</url>")
+            parts.append(f"<price>{price}</price><currencyId>RUR</currencyId>")
+            if category in self.categories:
+                parts.append(f"<categoryId>{self.categories[category]}</categoryId>")
+            if image:
+                parts.append(f"<picture>{escape(absolute(self.storage.url(image)))}</picture>")
+            parts.append(f"<name>{escape(title)}</name>")
+            if description:
+                parts.append(f"<description>{escape(description[:YML_DESCRIPTION_LIMIT])}</description>")
+            parts.append("</offer>\n")
+        return "".join(parts)
+
+
+class ExportFeed(Feed):
+    """Полная выгрузка лотов, включая снятые с публикации — для админки и команды export_lots"""
+    columns = ("pk", "title", "price", "category", "tags", "description", "is_active", "main_image",
+               "created_at", "updated_at")
+
+    def __init__(self, fmt):
+        super().__init__(f"export-{fmt}")
+        self.storage = Lot._meta.get_field("main_image").storage
+
+    def queryset(self):
+        return Lot.objects.order_by("pk")
+
+    def record(self, row):
+        data = dict(zip(("id", *self.columns[1:]), row))
+        data["url"] = absolute(reverse("lots:lot_detail", args=[data["id"]]))
+        data["main_image"] = absolute(self.storage.url(data["main_image"])) if data["main_image"] else ""
+        return data
+
+
+class CsvFeed(ExportFeed):
+    content_type = "text/csv; charset=utf-8"
+    filename = "lots.csv"
+
+    def __init__(self):
+        super().__init__("csv")
+
+    def header(self):
+        # BOM — чтобы Excel открыл файл в UTF-8
+        return "\ufeff" + self.write([("id", *self.columns[1:], "url")])
+
+    def write(self, records):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(records)
+        return buffer.getvalue()
+
+    def render(self, rows):
+        records = []
+        for row in rows:
+            data = self.record(row)
+            data["tags"] = ", ".join(data["tags"])
+            records.append([v.isoformat() if isinstance(v, datetime) else v for v in data.values()])
+        return self.write(records)
+
+
+class JsonlFeed(ExportFeed):
+    content_type = "application/x-ndjson; charset=utf-8"
+    filename = "lots.jsonl"
+
+    def __init__(self):
+        super().__init__("jsonl")
+
+    def render(self, rows):
+        return "".join(
+            json.dumps(self.record(row), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n" for row in rows
+        )
+
+
+EXPORT_FORMATS = {"csv": CsvFeed, "jsonl": JsonlFeed}
+
+
+def sitemap_pages():
+    return max(1, -(-Lot.objects.filter(is_active=True).count() // LOTS_PER_SITEMAP))
+
+
+class SitemapView(ConditionalGetMixin, View):
+    """/sitemap.xml: до 50 000 лотов — сам список адресов, больше — индекс файлов /sitemap-<n>.xml"""
+
+    def get_etag(self, request, *args, **kwargs):
+        version = catalogue_version()
+        return f"sitemap-{version}" if version is not None else None
+
+    def get(self, request, page=None):
+        pages = sitemap_pages()
+        if page is None:
+            if pages == 1:
+                return SitemapFeed(0).response()
+            return StreamingHttpResponse([sitemap_index(pages)], content_type=SitemapFeed.content_type)
+        if not 1 <= page <= pages or pages == 1:
+            raise Http404
+        return SitemapFeed(page - 1).response()
+
+
+class YmlFeedView(ConditionalGetMixin, View):
+    def get_etag(self, request, *args, **kwargs):
+        version = catalogue_version()
+        return f"yml-{version}" if version is not None else None
+
+    def get(self, request):
+        return YmlFeed().response()
@@ -0,0 +1,40 @@
+import zipfile
+
+from django import forms
+from django.contrib.postgres.forms import SimpleArrayField
+
+
+class TagsField(SimpleArrayField):
+    """
+    Теги через запятую для ArrayField.
+    Пустые элементы (в том числе хвостовая запятая от автокомплита) отбрасываются
+    """
+
+    def prepare_value(self, value):
+        if isinstance(value, list):
+            return ", ".join(value)
+        return value
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            value = [t for t in value.split(self.delimiter) if t.strip()]
+        return super().to_python(value)
+
+
+class LotImportForm(forms.Form):
+    manifest = forms.FileField(label="Манифест", help_text="CSV или JSONL: sku, title, price, description, "
+                                                           "category, tags, is_active, images")
+    photos = forms.FileField(label="Фото", required=False, help_text="ZIP-архив с фото, имена — как в столбце images")
+    dry_run = forms.BooleanField(label="Только проверить", required=False)
+
+    def clean_manifest(self):
+        manifest = self.cleaned_data["manifest"]
+        if not manifest.name.lower().endswith((".csv", ".jsonl", ".ndjson")):
+            raise forms.ValidationError("Нужен файл .csv или .jsonl")
+        return manifest
+
+    def clean_photos(self):
+        photos = self.cleaned_data["photos"]
+        if photos and not zipfile.is_zipfile(photos):
+            raise forms.ValidationError("Нужен ZIP-архив")
+        return photos
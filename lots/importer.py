@@ -0,0 +1,484 @@
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass, field
+from itertools import batched
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import connections, transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from . import taxonomy
+from .caching import bump_catalogue_version
+from .models import ImageStatus, Lot, LotImage
+from .tasks import enqueue, enqueue_many
+from .tracking import bulk_update_changed
+from .utils.images import file_hash, save_renditions
+
+logger = logging.getLogger(__name__)
+
+# поля лота, которые берутся из манифеста и обновляются при повторном импорте того же артикула
+IMPORT_FIELDS = ["title", "price", "description", "category", "tags", "is_active"]
+FALSE_VALUES = {"0", "false", "no", "нет", "n"}
+# цена — IntegerField
+MAX_PRICE = 2**31 - 1
+
+# задача воркера для импорта из админки; ход импорта хранится в кэше
+IMPORT_TASK = "import_lots"
+IMPORT_STATUS_TIMEOUT = 24 * 60 * 60
+# сколько ошибок в строках показывать на странице импорта
+IMPORT_STATUS_ERRORS = 50
+
+
+class ManifestError(ValueError):
+    pass
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    images: int = 0
+    failed_images: int = 0
+    errors: list = field(default_factory=list)
+
+    def summary(self):
+        return (f"строк: {self.rows}, новых лотов: {self.created}, обновлено: {self.updated}, "
+                f"фото: {self.images}, ошибок фото: {self.failed_images}, ошибок в строках: {len(self.errors)}")
+
+
+def read_manifest(path):
+    """(номер строки, словарь) из CSV или JSONL — формат по расширению файла"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError as e:
+                        yield number, ManifestError(f"некорректный JSON: {e}")
+        else:
+            # строка 1 — заголовок
+            for number, row in enumerate(csv.DictReader(f), 2):
+                yield number, row
+
+
+def split_list(value, separator):
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value or "").split(separator) if v.strip()]
+
+
+def parse_row(data):
+    """
+    Строка манифеста -> несохранённый лот и имена его фото (первое — основное).
+    Категория и теги нормализуются так же, как в Lot.save()
+    """
+    if isinstance(data, ManifestError):
+        raise data
+    if not isinstance(data, dict):
+        raise ManifestError("строка должна быть объектом JSON")
+    sku = str(data.get("sku") or "").strip()
+    title = str(data.get("title") or "").strip()
+    if not sku:
+        raise ManifestError("не указан sku")
+    if not title:
+        raise ManifestError("не указано название")
+    try:
+        price = int(str(data.get("price", "")).replace(" ", ""))
+    except ValueError:
+        raise ManifestError(f"некорректная цена: {data.get('price')!r}")
+    if not 0 <= price <= MAX_PRICE:
+        raise ManifestError(f"цена вне диапазона 0..{MAX_PRICE}: {price}")
+
+    is_active = data.get("is_active", True)
+    if isinstance(is_active, str):
+        is_active = is_active.strip().lower() not in FALSE_VALUES
+
+    lot = Lot(
+        external_sku=sku,
+        title=title,
+        price=price,
+        description=str(data.get("description") or "").strip(),
+        category=str(data.get("category") or "").strip(),
+        tags=split_list(data.get("tags"), ","),
+        is_active=bool(is_active),
+    )
+    lot.tags = lot.normalize_tags()
+    if lot.category:
+        lot.category = lot.normalize_category()
+    check_lengths(lot)
+    return lot, split_list(data.get("images"), ";")
+
+
+def check_lengths(lot):
+    # слишком длинное значение — ошибка строки, а не DataError, которая прервала бы всю пачку
+    for name in ("external_sku", "title", "category"):
+        limit = Lot._meta.get_field(name).max_length
+        if len(getattr(lot, name)) > limit:
+            raise ManifestError(f"{name} длиннее {limit} символов")
+    limit = Lot._meta.get_field("tags").base_field.max_length
+    for tag in lot.tags:
+        if len(tag) > limit:
+            raise ManifestError(f"тег длиннее {limit} символов: {tag[:30]!r}…")
+
+
+def field_values(instance, names):
+    # имена файлов вместо FieldFile: результат передаётся из дочернего процесса
+    values = {}
+    for name in names:
+        value = getattr(instance, name)
+        values[name] = value.name if isinstance(value, FieldFile) else value
+    return values
+
+
+def build_image(instance, source_field, path):
+    """Сжимает фото из локального файла сразу в версии, без промежуточной копии оригинала в хранилище"""
+    with open(path, "rb") as f:
+        setattr(instance, source_field, File(f, name=os.path.basename(path)))
+        changed = save_renditions(instance, source_field)
+    return field_values(instance, {*changed, source_field})
+
+
+def path_hash(path):
+    with open(path, "rb") as f:
+        return file_hash(f)
+
+
+def process_images(task):
+    """
+    Выполняется в дочернем процессе: фото одного лота (main=None — основное уже есть, только галерея).
+    В БД ничего не пишет — возвращает значения полей лота и строки галереи для записи пачкой в родителе
+    """
+    pk, main, paths = task
+    lot_values = None
+    if main:
+        try:
+            lot_values = build_image(Lot(pk=pk), "main_image", main)
+        except Exception:
+            # лот без основного фото повторный запуск обработает заново вместе с галереей:
+            # сохранённая сейчас галерея задвоилась бы
+            return pk, None, [], 1 + len(paths)
+
+    gallery, failed = [], 0
+    for path in paths:
+        try:
+            gallery.append(build_image(LotImage(lot_id=pk), "image", path))
+        except Exception:
+            failed += 1
+    return pk, lot_values, gallery, failed
+
+
+class LotImporter:
+    """
+    Импорт манифеста (CSV/JSONL) пачками: по каждой пачке один INSERT ... ON CONFLICT (external_sku),
+    поэтому повторный запуск обновляет уже загруженные лоты. Фото ищутся в images_dir
+    """
+
+    def __init__(self, images_dir, batch_size=500, dry_run=False, progress=None):
+        self.images_dir = images_dir
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.progress = progress or (lambda message: None)
+        self.report = ImportReport()
+        # артикулы из уже обработанных пачек
+        self.seen = set()
+        # артикул -> (pk лота, путь к основному фото или None, пути к фото галереи) — фото, которых у лота нет
+        self.image_tasks = {}
+        # артикул -> задачи очереди для фото лота, которые воркер не смог обработать
+        self.retry_jobs = {}
+
+    def image_path(self, name):
+        path = os.path.normpath(os.path.join(self.images_dir, name))
+        if not path.startswith(os.path.normpath(self.images_dir) + os.sep) or not os.path.isfile(path):
+            raise ManifestError(f"нет файла фото {name!r}")
+        return path
+
+    def import_manifest(self, path):
+        started = time.monotonic()
+        for batch in batched(read_manifest(path), self.batch_size):
+            self.import_batch(batch)
+            rate = self.report.rows / max(time.monotonic() - started, 0.001)
+            self.progress(f"строк: {self.report.rows}, {rate:.0f} строк/с")
+
+        if self.dry_run:
+            self.report.images = sum(bool(main) + len(paths) for pk, main, paths in self.image_tasks.values())
+            self.report.images += sum(len(jobs) for jobs in self.retry_jobs.values())
+        else:
+            # bulk_create минует сигналы: счётчики меню и кэш страниц обновляются целиком
+            taxonomy.rebuild()
+            bump_catalogue_version()
+        return self.report
+
+    def import_batch(self, batch):
+        lots = {}
+        images = {}
+        for number, data in batch:
+            self.report.rows += 1
+            try:
+                lot, names = parse_row(data)
+                paths = [self.image_path(name) for name in names]
+            except ManifestError as e:
+                self.report.errors.append(f"строка {number}: {e}")
+                continue
+            # повтор артикула в манифесте: действует последняя строка
+            lots[lot.external_sku] = lot
+            images[lot.external_sku] = paths
+
+        existing = {
+            sku: (pk, main_image, status)
+            for sku, pk, main_image, status in Lot.objects.filter(external_sku__in=lots)
+            .values_list("external_sku", "pk", "main_image", "image_status")
+        }
+        # артикул, повторённый в следующей пачке, уже посчитан (при dry_run его нет и в БД)
+        new = lots.keys() - self.seen
+        self.report.created += len(new - existing.keys())
+        self.report.updated += len(new & existing.keys())
+        self.seen |= new
+
+        if lots and not self.dry_run:
+            now = timezone.now()
+            for lot in lots.values():
+                lot.updated_at = now
+            Lot.objects.bulk_create(
+                lots.values(),
+                update_conflicts=True,
+                unique_fields=["external_sku"],
+                update_fields=[*IMPORT_FIELDS, "updated_at"],
+            )
+        # фото пишутся после всех пачек, поэтому повтор артикула заменяет его задачи, а не добавляет вторые
+        stored = self.stored_gallery([pk for pk, main_image, _ in existing.values() if main_image])
+        for sku, lot in lots.items():
+            self.image_tasks.pop(sku, None)
+            self.retry_jobs.pop(sku, None)
+            paths = images[sku]
+            pk, main_image, status = existing.get(sku, (lot.pk, "", None))
+            if not paths:
+                continue
+            if not main_image:
+                self.image_tasks[sku] = (pk, paths[0], paths[1:])
+                continue
+
+            # основное фото уже есть: повторный запуск его не обрабатывает, если оно не упало у воркера
+            retry = []
+            if status == ImageStatus.FAILED:
+                retry.append(rendition_job("lots.lot", pk, "main_image", main_image))
+            # у галереи без хэшей исходников сверять не с чем: лишние копии хуже пропуска
+            gallery = stored.get(pk, {})
+            missing = []
+            if gallery is not None:
+                for path in paths[1:]:
+                    row = gallery.get(path_hash(path))
+                    if row is None:
+                        missing.append(path)
+                    elif row[1] == ImageStatus.FAILED:
+                        retry.append(rendition_job("lots.lotimage", row[0], "image", row[2]))
+            if missing:
+                self.image_tasks[sku] = (pk, None, missing)
+            if retry:
+                self.retry_jobs[sku] = retry
+
+    def stored_gallery(self, lot_ids):
+        """
+        lot_id -> {хэш исходника: (pk, статус, имя файла)} для уже загруженной галереи;
+        None, если у какого-то фото лота хэша нет
+        """
+        stored = {}
+        rows = LotImage.objects.filter(lot_id__in=lot_ids).values_list(
+            "lot_id", "pk", "image_hash", "image_status", "image"
+        )
+        for lot_id, pk, image_hash, status, name in rows:
+            gallery = stored.setdefault(lot_id, {})
+            if gallery is None:
+                continue
+            if not image_hash:
+                stored[lot_id] = None
+                continue
+            gallery[image_hash] = (pk, status, name)
+        return stored
+
+    def build_images(self, processes):
+        """Сжатие фото в пуле процессов (команда import_lots); результаты записываются пачками"""
+        if self.dry_run:
+            return self.report
+
+        if self.image_tasks:
+            # дочерние процессы открывают свои соединения с БД
+            connections.close_all()
+            started = time.monotonic()
+            context = multiprocessing.get_context("fork")
+            with context.Pool(processes) as pool:
+                results = pool.imap_unordered(process_images, self.image_tasks.values())
+                for chunk in batched(results, 50):
+                    self.write_images(chunk)
+                    rate = self.report.images / max(time.monotonic() - started, 0.001)
+                    self.progress(f"фото: {self.report.images}, ошибок {self.report.failed_images}, {rate:.1f} фото/с")
+
+        with transaction.atomic():
+            self.requeue_failed()
+        bump_catalogue_version()
+        return self.report
+
+    def write_images(self, results):
+        lots, gallery = [], []
+        for pk, lot_values, images, failed in results:
+            self.report.failed_images += failed
+            self.report.images += len(images) + (1 if lot_values else 0)
+            # только свои поля каждого лота: новая галерея у лота с фото меняет лишь updated_at
+            changed = {**lot_values, "image_status": ImageStatus.READY} if lot_values else {}
+            if changed or images:
+                lots.append((pk, {**changed, "updated_at": timezone.now()}))
+            gallery += [LotImage(lot_id=pk, **values) for values in images]
+
+        with transaction.atomic():
+            bulk_update_changed(Lot, lots)
+            LotImage.objects.bulk_create(gallery)
+
+    def requeue_failed(self):
+        """Фото, которые воркер не смог обработать, — снова в очередь после коммита"""
+        jobs = [job for jobs in self.retry_jobs.values() for job in jobs]
+        for model in (Lot, LotImage):
+            pks = [job["pk"] for job in jobs if job["model"] == model._meta.label_lower]
+            if pks:
+                model.objects.filter(pk__in=pks).update(image_status=ImageStatus.PENDING)
+        if jobs:
+            transaction.on_commit(lambda: enqueue_many(jobs))
+        self.report.images += len(jobs)
+        return jobs
+
+    def enqueue_images(self):
+        """
+        Для импорта из админки: оригиналы копируются в хранилище, а сжатие идёт отдельными
+        задачами очереди — их разбирают все процессы воркера, а не одна задача импорта
+        """
+        if self.dry_run:
+            return self.report
+
+        lots, gallery = [], []
+        for number, (pk, main, paths) in enumerate(self.image_tasks.values(), 1):
+            if number % 100 == 0:
+                self.progress(f"копирование фото: {number} из {len(self.image_tasks)} лотов")
+            if main:
+                lot = Lot(pk=pk, image_status=ImageStatus.PENDING)
+                with open(main, "rb") as f:
+                    lot.main_image.save(os.path.basename(main), File(f), save=False)
+                lots.append(lot)
+            for path in paths:
+                image = LotImage(lot_id=pk, image_status=ImageStatus.PENDING)
+                with open(path, "rb") as f:
+                    # хэш исходника сразу: повторный импорт узнает фото, даже если воркер его ещё не обработал
+                    image.image_hash = file_hash(f)
+                    image.image.save(os.path.basename(path), File(f), save=False)
+                gallery.append(image)
+
+        with transaction.atomic():
+            Lot.objects.bulk_update(lots, ["main_image", "image_status"])
+            LotImage.objects.bulk_create(gallery)
+            jobs = [
+                rendition_job(obj._meta.label_lower, obj.pk, source, getattr(obj, source).name)
+                for objs, source in ((lots, "main_image"), (gallery, "image"))
+                for obj in objs
+            ]
+            if jobs:
+                transaction.on_commit(lambda: enqueue_many(jobs))
+            self.requeue_failed()
+
+        self.report.images += len(jobs)
+        bump_catalogue_version()
+        return self.report
+
+
+def rendition_job(model, pk, field, name):
+    # формат задачи — как у lots.tasks.schedule_renditions
+    return {"model": model, "pk": pk, "field": field, "name": name}
+
+
+def import_status_key(import_id):
+    return f"lots:import:{import_id}"
+
+
+def import_status(import_id):
+    return cache.get(import_status_key(import_id))
+
+
+def set_import_status(import_id, **values):
+    # статус пишет только задача импорта, поэтому гонок между get и set нет
+    status = {**(import_status(import_id) or {}), **values}
+    cache.set(import_status_key(import_id), status, IMPORT_STATUS_TIMEOUT)
+
+
+def save_upload(upload, path):
+    with open(path, "wb") as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+
+
+def stage_import(manifest, photos=None, dry_run=False):
+    """
+    Складывает загруженные в админке файлы в IMPORT_STAGING_ROOT и ставит импорт в очередь воркера.
+    Возвращает id импорта для страницы с его ходом
+    """
+    import_id = uuid.uuid4().hex
+    workdir = os.path.join(settings.IMPORT_STAGING_ROOT, import_id)
+    os.makedirs(workdir)
+    # формат манифеста определяется по расширению
+    manifest_name = "manifest" + os.path.splitext(manifest.name)[1].lower()
+    save_upload(manifest, os.path.join(workdir, manifest_name))
+    if photos:
+        save_upload(photos, os.path.join(workdir, "photos.zip"))
+
+    set_import_status(import_id, state="queued", dry_run=dry_run, message="ожидает воркера")
+    # без Redis задача выполняется сразу, в этом же запросе
+    enqueue({"task": IMPORT_TASK, "id": import_id, "manifest": manifest_name, "dry_run": dry_run})
+    return import_id
+
+
+def run_staged_import(job):
+    """Задача воркера: импорт файлов, подготовленных stage_import(). Каталог удаляется после импорта"""
+    import_id = job["id"]
+    workdir = os.path.join(settings.IMPORT_STAGING_ROOT, import_id)
+    if not os.path.isdir(workdir):
+        # задача повторно взята из очереди, а импорт уже завершился
+        return None
+
+    try:
+        set_import_status(import_id, state="running", message="распаковка фото")
+        images_dir = os.path.join(workdir, "photos")
+        os.makedirs(images_dir, exist_ok=True)
+        archive = os.path.join(workdir, "photos.zip")
+        if os.path.exists(archive):
+            with zipfile.ZipFile(archive) as f:
+                f.extractall(images_dir)
+
+        importer = LotImporter(
+            images_dir,
+            dry_run=job["dry_run"],
+            progress=lambda message: set_import_status(import_id, message=message),
+        )
+        importer.import_manifest(os.path.join(workdir, job["manifest"]))
+        report = importer.enqueue_images()
+    except Exception as e:
+        logger.exception("Ошибка импорта %s", import_id)
+        set_import_status(import_id, state="failed", message=str(e))
+        return "failed"
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    set_import_status(
+        import_id,
+        state="done",
+        message=report.summary(),
+        errors=report.errors[:IMPORT_STATUS_ERRORS],
+        error_count=len(report.errors),
+    )
+    return "ready"
@@ -0,0 +1,175 @@
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import time
+from io import BytesIO
+
+import PIL
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from lots.models import Lot, LotImage
+from lots.utils.images import render
+
+# наборы версий, которые реально строятся в проекте
+RENDITION_SETS = {
+    "lot": Lot.RENDITIONS["main_image"],
+    "lotimage": LotImage.RENDITIONS["image"],
+}
+
+SAVE_FORMATS = {
+    "jpeg": ("JPEG", {"quality": 92}),
+    "png": ("PNG", {}),
+    "heic": ("HEIF", {"quality": 90}),
+}
+
+
+def make_fixture(fmt, width, height):
+    """
+    Синтетическое фото: шум и градиенты сжимаются похоже на реальные снимки,
+    в отличие от однотонной заливки
+    """
+    size = (width, height)
+    img = Image.merge("RGB", [
+        Image.effect_noise(size, 48),
+        Image.linear_gradient("L").resize(size),
+        Image.radial_gradient("L").resize(size),
+    ])
+    save_format, params = SAVE_FORMATS[fmt]
+    buffer = BytesIO()
+    img.save(buffer, format=save_format, **params)
+    return buffer.getvalue()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_case(renditions, fmt, width, height, iterations, conn):
+    """
+    Выполняется в отдельном процессе, чтобы пик RSS относился только к этому случаю
+    """
+    try:
+        conn.send(measure(renditions, fmt, width, height, iterations))
+    except Exception as e:
+        # один неудачный случай не должен терять результаты остальных
+        conn.send({"format": fmt, "width": width, "height": height, "error": f"{type(e).__name__}: {e}"})
+    conn.close()
+
+
+def measure(renditions, fmt, width, height, iterations):
+    data = make_fixture(fmt, width, height)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    wall, cpu = [], []
+    outputs = []
+    for _ in range(iterations):
+        started_wall, started_cpu = time.perf_counter(), time.process_time()
+        outputs, _ = render(BytesIO(data), renditions)
+        wall.append(time.perf_counter() - started_wall)
+        cpu.append(time.process_time() - started_cpu)
+
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "format": fmt,
+        "width": width,
+        "height": height,
+        "source_bytes": len(data),
+        "iterations": iterations,
+        "throughput_per_s": round(iterations / sum(wall), 3),
+        "wall_p50_ms": round(percentile(wall, 50) * 1000, 1),
+        "wall_p95_ms": round(percentile(wall, 95) * 1000, 1),
+        "cpu_mean_ms": round(sum(cpu) / iterations * 1000, 1),
+        # ru_maxrss в Linux в килобайтах
+        "peak_rss_mb": round(rss_peak / 1024, 1),
+        "peak_rss_delta_mb": round((rss_peak - rss_before) / 1024, 1),
+        "renditions": [
+            {
+                "format": rendition.format.lower(),
+                "size": rendition.size,
+                "quality": rendition.quality,
+                "width": w,
+                "height": h,
+                "bytes": content.size,
+            }
+            for rendition, content, (w, h) in outputs
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark the image rendition pipeline on generated fixtures"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--renditions", choices=RENDITION_SETS, default="lot",
+                            help="Набор версий, который строится для каждого исходника")
+        parser.add_argument("--formats", default="jpeg,png,heic",
+                            help="Форматы исходников через запятую: jpeg, png, heic")
+        parser.add_argument("--resolutions", default="1280x960,3000x2000,6000x4000",
+                            help="Разрешения исходников через запятую, ШИРИНАxВЫСОТА")
+        parser.add_argument("--skip", default="",
+                            help="Случаи, которые не запускаются, через запятую: heic:6000x4000")
+        parser.add_argument("--iterations", type=int, default=5)
+        parser.add_argument("--output", help="Путь к JSON-файлу с результатами")
+
+    def handle(self, *args, **options):
+        formats = [f.strip().lower() for f in options["formats"].split(",") if f.strip()]
+        unknown = set(formats) - set(SAVE_FORMATS)
+        if unknown:
+            raise CommandError(f"Неизвестные форматы: {', '.join(sorted(unknown))}")
+        try:
+            resolutions = [tuple(map(int, r.lower().split("x"))) for r in options["resolutions"].split(",")]
+        except ValueError:
+            raise CommandError(f"Неверный формат --resolutions: {options['resolutions']}")
+        iterations = max(1, options["iterations"])
+        renditions = list(RENDITION_SETS[options["renditions"]])
+        skip = {c.strip().lower() for c in options["skip"].split(",") if c.strip()}
+
+        context = multiprocessing.get_context("fork")
+        cases = []
+        for fmt in formats:
+            for width, height in resolutions:
+                if f"{fmt}:{width}x{height}" in skip:
+                    continue
+                parent, child = context.Pipe(duplex=False)
+                process = context.Process(target=run_case,
+                                          args=(renditions, fmt, width, height, iterations, child))
+                process.start()
+                child.close()
+                try:
+                    case = parent.recv()
+                except EOFError:
+                    # процесс убит (нехватка памяти, падение декодера) и ничего не прислал
+                    case = {"format": fmt, "width": width, "height": height,
+                            "error": "процесс бенчмарка завершился без результата"}
+                finally:
+                    process.join()
+                cases.append(case)
+
+                if "error" in case:
+                    self.stderr.write(f"{fmt:>4} {width}x{height}: ошибка — {case['error']}")
+                    continue
+                total = sum(r["bytes"] for r in case["renditions"])
+                self.stdout.write(
+                    f"{fmt:>4} {width}x{height}: {case['throughput_per_s']:.2f} изобр./с, "
+                    f"p50 {case['wall_p50_ms']} мс, p95 {case['wall_p95_ms']} мс, "
+                    f"CPU {case['cpu_mean_ms']} мс, пик RSS {case['peak_rss_mb']} МБ, "
+                    f"версии {total / 1024:.0f} КБ"
+                )
+
+        if options["output"]:
+            report = {
+                "rendition_set": options["renditions"],
+                "python": platform.python_version(),
+                "pillow": PIL.__version__,
+                "cpu_count": os.cpu_count(),
+                "machine": platform.machine(),
+                "cases": cases,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Результаты записаны в {options['output']}"))
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lots.feeds import EXPORT_FORMATS, SitemapFeed, YmlFeed, sitemap_index, sitemap_pages
+
+FORMATS = ("csv", "jsonl", "yml", "sitemap")
+
+
+class Command(BaseCommand):
+    help = "Stream the lot catalogue as CSV, JSONL, a YML product feed or a sitemap"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--page", type=int, default=None,
+                            help="Номер файла sitemap (1..N); без него — sitemap.xml или индекс файлов")
+        parser.add_argument("--output", help="Путь к файлу; по умолчанию stdout")
+
+    def handle(self, *args, **options):
+        chunks = self.chunks(options["format"], options["page"])
+        out = open(options["output"], "w", encoding="utf-8", newline="") if options["output"] else sys.stdout
+        try:
+            # пачки пишутся по мере готовности: в памяти одна пачка, а не вся выгрузка
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    def chunks(self, fmt, page):
+        if fmt in EXPORT_FORMATS:
+            return EXPORT_FORMATS[fmt]().stream()
+        if fmt == "yml":
+            return YmlFeed().stream()
+
+        pages = sitemap_pages()
+        if page is None:
+            return SitemapFeed(0).stream() if pages == 1 else [sitemap_index(pages)]
+        if not 1 <= page <= pages:
+            raise CommandError(f"Файлов sitemap всего {pages}")
+        return SitemapFeed(page - 1).stream()
@@ -0,0 +1,45 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lots.importer import LotImporter
+
+
+class Command(BaseCommand):
+    help = "Import lots from a CSV/JSONL manifest and a folder of photos; re-runs update lots by external SKU"
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest", help="CSV или JSONL: sku, title, price, description, category, tags, "
+                                             "is_active, images (через «;», первое — основное фото)")
+        parser.add_argument("--images", help="Папка с фото; по умолчанию папка манифеста")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только проверить манифест и посчитать новые и существующие лоты")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                            help="Процессов для сжатия фото")
+
+    def handle(self, *args, **options):
+        manifest = options["manifest"]
+        if not os.path.isfile(manifest):
+            raise CommandError(f"Файл {manifest} не найден")
+        images_dir = options["images"] or os.path.dirname(os.path.abspath(manifest))
+        if not os.path.isdir(images_dir):
+            raise CommandError(f"Папка {images_dir} не найдена")
+
+        importer = LotImporter(
+            images_dir,
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            progress=lambda message: self.stdout.write(message),
+        )
+        started = time.monotonic()
+        importer.import_manifest(manifest)
+        importer.build_images(options["processes"])
+        report = importer.report
+
+        for message in report.errors:
+            self.stderr.write(message)
+        elapsed = time.monotonic() - started
+        prefix = "Проверка (без записи): " if options["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{report.summary()} за {elapsed:.1f} с"))
@@ -0,0 +1,166 @@
+import json
+import multiprocessing
+import os
+import time
+from itertools import batched
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from lots.caching import bump_catalogue_version
+from lots.models import ImageStatus, Lot, LotImage
+from lots.tracking import bulk_update_changed
+from lots.utils.images import release_files, rendition_names, save_renditions
+
+# модель -> (поле с оригиналом, путь к лоту для фильтров)
+TARGETS = {
+    "lot": (Lot, "main_image", ""),
+    "lotimage": (LotImage, "image", "lot__"),
+}
+
+
+def rebuild_batch(model_name, pks):
+    """
+    Выполняется в дочернем процессе: пересобирает производные версии пачки строк.
+    В БД ничего не пишет — возвращает значения полей и файлы, которые станут лишними
+    """
+    model, field, _ = TARGETS[model_name]
+    results = []
+    failed = 0
+    for instance in model.objects.filter(pk__in=pks):
+        old_names = rendition_names(instance, field)
+        try:
+            save_renditions(instance, field, rebuild_source=False)
+        except Exception:
+            failed += 1
+            continue
+        # только поля, значения которых действительно изменились: остальные столбцы строки не перезаписываются
+        values = {name: getattr(instance, name) for name in instance.dirty_fields}
+        results.append((instance.pk, values, sorted(old_names - rendition_names(instance, field))))
+    return pks, results, failed
+
+
+class Command(BaseCommand):
+    help = "Rebuild image renditions for existing lots and gallery images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=[*TARGETS, "all"], default="all")
+        parser.add_argument("--category", help="Только лоты этой категории")
+        parser.add_argument("--since", help="Лоты, созданные начиная с даты (YYYY-MM-DD)")
+        parser.add_argument("--until", help="Лоты, созданные до даты включительно (YYYY-MM-DD)")
+        parser.add_argument("--processes", type=int, default=os.cpu_count())
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--checkpoint",
+            help="JSON-файл с последним обработанным pk; если файл есть, обработка продолжается с него. "
+                 "Позиция своя для каждой модели и набора фильтров и удаляется, когда модель пройдена до конца",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = {}
+        if options["checkpoint"] and os.path.exists(options["checkpoint"]):
+            with open(options["checkpoint"]) as f:
+                checkpoint = json.load(f)
+            self.stdout.write(f"Продолжаем с контрольной точки: {checkpoint}")
+
+        models = list(TARGETS) if options["model"] == "all" else [options["model"]]
+        for model_name in models:
+            self.rebuild(model_name, checkpoint, options)
+
+    def get_queryset(self, model_name, options):
+        model, field, lot_path = TARGETS[model_name]
+        qs = model.objects.filter(image_status=ImageStatus.READY).exclude(**{field: ""})
+
+        if options["category"]:
+            qs = qs.filter(**{f"{lot_path}category__iexact": options["category"]})
+        for option, lookup in (("since", "gte"), ("until", "lte")):
+            if options[option]:
+                day = parse_date(options[option])
+                if day is None:
+                    raise CommandError(f"Неверная дата --{option}: {options[option]}")
+                qs = qs.filter(**{f"{lot_path}created_at__date__{lookup}": day})
+        return qs
+
+    def checkpoint_key(self, model_name, options):
+        # с другими фильтрами — другой набор строк, позиция от прошлого запуска к нему не относится
+        filters = "&".join(f"{name}={options[name]}" for name in ("category", "since", "until") if options[name])
+        return f"{model_name}?{filters}" if filters else model_name
+
+    def rebuild(self, model_name, checkpoint, options):
+        key = self.checkpoint_key(model_name, options)
+        qs = self.get_queryset(model_name, options)
+        last_pk = checkpoint.get(key)
+        if last_pk:
+            qs = qs.filter(pk__gt=last_pk)
+
+        # список pk читается целиком до пула: ленивый генератор пула выполнял бы запрос
+        # в его служебном потоке, на соединении, которое никто не закрывает
+        pks = list(qs.order_by("pk").values_list("pk", flat=True))
+        batches = [(model_name, batch) for batch in batched(pks, options["batch_size"])]
+
+        # дочерние процессы открывают свои соединения с БД
+        connections.close_all()
+
+        done = failed = 0
+        started = time.monotonic()
+        context = multiprocessing.get_context("fork")
+        with context.Pool(options["processes"]) as pool:
+            # imap сохраняет порядок пачек, поэтому контрольная точка всегда монотонна
+            for batch_pks, results, batch_failed in pool.imap(run_batch, batches):
+                self.write_results(model_name, results)
+                done += len(results)
+                failed += batch_failed
+
+                checkpoint[key] = batch_pks[-1]
+                self.save_checkpoint(checkpoint, options["checkpoint"])
+
+                rate = done / max(time.monotonic() - started, 0.001)
+                self.stdout.write(f"{model_name}: {done} готово, {failed} ошибок, {rate:.1f} изобр./с")
+
+        # модель пройдена: следующий запуск с тем же файлом начнёт её сначала
+        if checkpoint.pop(key, None) is not None:
+            self.save_checkpoint(checkpoint, options["checkpoint"])
+        self.stdout.write(self.style.SUCCESS(f"{model_name}: пересобрано {done}, ошибок {failed}"))
+
+    def write_results(self, model_name, results):
+        model = TARGETS[model_name][0]
+        if not results:
+            return
+
+        rows = []
+        for pk, values, _ in results:
+            # строка, взявшая версии у самой себя, не изменилась — её не трогаем
+            if values and hasattr(model, "updated_at"):
+                values["updated_at"] = timezone.now()
+            rows.append((pk, values))
+        bulk_update_changed(model, rows)
+        if model is LotImage:
+            # пересобранная галерея меняет страницу лота (Last-Modified)
+            pks = [pk for pk, values, _ in results if values]
+            Lot.objects.filter(pk__in=LotImage.objects.filter(pk__in=pks).values("lot_id")).update(
+                updated_at=timezone.now()
+            )
+        # bulk_update сигналов не шлёт: закэшированные страницы сбрасываются явно
+        bump_catalogue_version()
+
+        # старые файлы удаляются только после того, как БД ссылается на новые,
+        # и только если их не используют другие строки с тем же исходником
+        release_files(model, TARGETS[model_name][1], {name for _, _, stale in results for name in stale})
+
+    def save_checkpoint(self, checkpoint, path):
+        if not path:
+            return
+        if not checkpoint:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, path)
+
+
+def run_batch(task):
+    return rebuild_batch(*task)
@@ -0,0 +1,67 @@
+import multiprocessing
+import resource
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from lots.tasks import ack_job, pop_job, requeue_stale_jobs, run_job
+
+
+def limit_memory(limit_mb):
+    if limit_mb:
+        limit = limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class Command(BaseCommand):
+    help = "Run background worker for image renditions and admin lot imports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=settings.RENDITION_WORKER_PROCESSES,
+            help="Количество процессов для обработки изображений",
+        )
+        parser.add_argument(
+            "--memory-limit", type=int, default=None,
+            help="Жёсткий лимит адресного пространства процесса, МБ: "
+                 "при превышении задача падает с MemoryError, а не убивается OOM",
+        )
+
+    def handle(self, *args, **options):
+        processes = max(1, options["processes"])
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь незавершённых задач: {requeued}")
+
+        # дочерние процессы не должны наследовать открытые соединения с БД
+        connections.close_all()
+
+        # берём из очереди не больше задач, чем свободных процессов,
+        # остальные остаются в Redis и переживут перезапуск воркера
+        slots = threading.BoundedSemaphore(processes)
+
+        def on_done(raw, future):
+            try:
+                self.stdout.write(f"{raw} -> {future.result()}")
+            except Exception as e:
+                self.stderr.write(f"{raw} -> {e}")
+            finally:
+                ack_job(raw)
+                slots.release()
+
+        self.stdout.write(f"Воркер изображений запущен, процессов: {processes}")
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                 initializer=limit_memory, initargs=(options["memory_limit"],)) as pool:
+            while True:
+                slots.acquire()
+                raw = pop_job()
+                if raw is None:
+                    slots.release()
+                    continue
+                future = pool.submit(run_job, raw)
+                future.add_done_callback(lambda f, raw=raw: on_done(raw, f))
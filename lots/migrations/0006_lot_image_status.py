@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0005_lotimage_preview_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lot",
+            name="image_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "В обработке"),
+                    ("ready", "Готово"),
+                    ("failed", "Ошибка обработки"),
+                ],
+                default="ready",
+                editable=False,
+                max_length=10,
+                verbose_name="Статус изображения",
+            ),
+        ),
+        migrations.AddField(
+            model_name="lotimage",
+            name="image_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "В обработке"),
+                    ("ready", "Готово"),
+                    ("failed", "Ошибка обработки"),
+                ],
+                default="ready",
+                editable=False,
+                max_length=10,
+                verbose_name="Статус изображения",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0006_lot_image_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lot",
+            name="renditions",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                editable=False,
+                verbose_name="Доп. версии изображения",
+            ),
+        ),
+        migrations.AddField(
+            model_name="lotimage",
+            name="renditions",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                editable=False,
+                verbose_name="Доп. версии изображения",
+            ),
+        ),
+    ]
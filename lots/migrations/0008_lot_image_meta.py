@@ -0,0 +1,75 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0007_lot_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lot",
+            name="image_bytes",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name="Размер изображения, байт",
+            ),
+        ),
+        migrations.AddField(
+            model_name="lot",
+            name="image_color",
+            field=models.CharField(
+                blank=True, editable=False, max_length=7, verbose_name="Основной цвет"
+            ),
+        ),
+        migrations.AddField(
+            model_name="lot",
+            name="image_height",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Высота изображения"
+            ),
+        ),
+        migrations.AddField(
+            model_name="lot",
+            name="image_width",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Ширина изображения"
+            ),
+        ),
+        migrations.AddField(
+            model_name="lotimage",
+            name="image_bytes",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name="Размер изображения, байт",
+            ),
+        ),
+        migrations.AddField(
+            model_name="lotimage",
+            name="image_color",
+            field=models.CharField(
+                blank=True, editable=False, max_length=7, verbose_name="Основной цвет"
+            ),
+        ),
+        migrations.AddField(
+            model_name="lotimage",
+            name="image_height",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Высота изображения"
+            ),
+        ),
+        migrations.AddField(
+            model_name="lotimage",
+            name="image_width",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Ширина изображения"
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.core.files.storage import default_storage
+from django.db import migrations
+from PIL import Image
+
+BATCH_SIZE = 200
+
+META_FIELDS = ["image_width", "image_height", "image_bytes", "image_color"]
+
+
+def read_meta(obj, image_name, preview_name):
+    try:
+        with default_storage.open(image_name) as f:
+            # Image.open читает только заголовок, пиксели не декодируются
+            obj.image_width, obj.image_height = Image.open(f).size
+        obj.image_bytes = default_storage.size(image_name)
+
+        # цвет считаем по превью: оно маленькое и декодируется быстро
+        with default_storage.open(preview_name or image_name) as f:
+            img = Image.open(f)
+            img.draft("RGB", (64, 64))
+            r, g, b = img.convert("RGB").resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+        obj.image_color = f"#{r:02x}{g:02x}{b:02x}"
+        return True
+    except Exception:
+        # битые и потерянные файлы оставляем без метаданных
+        return False
+
+
+def backfill(model, image_field):
+    batch = []
+    qs = (
+        model.objects.filter(image_width__isnull=True)
+        .exclude(**{image_field: ""})
+        .exclude(**{f"{image_field}__isnull": True})
+        .only("pk", image_field, "preview_image", *META_FIELDS)
+        .order_by("pk")
+    )
+    for obj in qs.iterator(chunk_size=BATCH_SIZE):
+        if read_meta(obj, getattr(obj, image_field).name, obj.preview_image.name):
+            batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_update(batch, META_FIELDS)
+            batch = []
+    if batch:
+        model.objects.bulk_update(batch, META_FIELDS)
+
+
+def backfill_image_meta(apps, schema_editor):
+    backfill(apps.get_model("lots", "Lot"), "main_image")
+    backfill(apps.get_model("lots", "LotImage"), "image")
+
+
+class Migration(migrations.Migration):
+    # каждая пачка коммитится отдельно, без долгой блокировки всей таблицы
+    atomic = False
+
+    dependencies = [
+        ("lots", "0008_lot_image_meta"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_image_meta, migrations.RunPython.noop),
+    ]
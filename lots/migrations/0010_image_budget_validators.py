@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import lots.utils.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0009_backfill_image_meta"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="lot",
+            name="main_image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                upload_to="lots/images/",
+                validators=[lots.utils.images.validate_image_budget],
+                verbose_name="Основное изображение",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="lotimage",
+            name="image",
+            field=models.ImageField(
+                upload_to="lots/gallery/",
+                validators=[lots.utils.images.validate_image_budget],
+                verbose_name="Доп. фото",
+            ),
+        ),
+    ]
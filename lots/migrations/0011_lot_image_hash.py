@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0010_image_budget_validators"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lot",
+            name="image_hash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=32,
+                verbose_name="Хэш исходника",
+            ),
+        ),
+        migrations.AddField(
+            model_name="lotimage",
+            name="image_hash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=32,
+                verbose_name="Хэш исходника",
+            ),
+        ),
+    ]
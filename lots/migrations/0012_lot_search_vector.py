@@ -0,0 +1,56 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# веса: A — название, B — теги, C — категория, D — описание
+SEARCH_VECTOR_SQL = """
+CREATE FUNCTION lots_lot_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', replace(coalesce(NEW.tags, ''), ',', ' ')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(NEW.category, '')), 'C') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+-- пересчёт только при изменении текстовых полей: обновления статуса фото и т.п. его не трогают
+CREATE TRIGGER lots_lot_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, tags, category, description ON lots_lot
+    FOR EACH ROW EXECUTE FUNCTION lots_lot_search_vector_update();
+
+UPDATE lots_lot SET title = title;
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP TRIGGER IF EXISTS lots_lot_search_vector_trigger ON lots_lot;
+DROP FUNCTION IF EXISTS lots_lot_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0011_lot_image_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lot",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        # индекс строится после заполнения, так быстрее, чем обновлять его построчно
+        migrations.RunSQL(SEARCH_VECTOR_SQL, DROP_SEARCH_VECTOR_SQL),
+        migrations.AddIndex(
+            model_name="lot",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="lot_search_vector_gin"
+            ),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def fill_tags(apps, schema_editor):
+    Lot = apps.get_model("lots", "Lot")
+    Tag = apps.get_model("lots", "Tag")
+    names = set()
+    for tags in (
+        Lot.objects.exclude(tags="")
+        .values_list("tags", flat=True)
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        names.update(t.strip() for t in tags.split(",") if t.strip())
+    Tag.objects.bulk_create(
+        [Tag(name=name) for name in sorted(names)],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0012_lot_search_vector"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name="Tag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=255, unique=True, verbose_name="Тег"),
+                ),
+            ],
+            options={
+                "verbose_name": "Тег",
+                "verbose_name_plural": "Теги",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="lot",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["title"], name="lot_title_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tag",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["name"], name="tag_name_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+        migrations.RunPython(fill_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import re
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def split_tags(value):
+    result = []
+    for t in (value or "").split(","):
+        t = re.sub(r"\s+", " ", t.strip().lower())[:100]
+        if t and t not in result:
+            result.append(t)
+    return result
+
+
+def csv_to_array(apps, schema_editor):
+    Lot = apps.get_model("lots", "Lot")
+    last_pk = 0
+    while True:
+        # пачками по pk, каждая пачка в своей транзакции
+        batch = list(
+            Lot.objects.filter(pk__gt=last_pk)
+            .exclude(tags="")
+            .only("pk", "tags")
+            .order_by("pk")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for lot in batch:
+            lot.tags_array = split_tags(lot.tags)
+        Lot.objects.bulk_update(batch, ["tags_array"])
+        last_pk = batch[-1].pk
+
+
+def array_to_csv(apps, schema_editor):
+    Lot = apps.get_model("lots", "Lot")
+    batch = []
+    for lot in (
+        Lot.objects.exclude(tags_array=[])
+        .only("pk", "tags_array")
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        lot.tags = ", ".join(lot.tags_array)
+        batch.append(lot)
+        if len(batch) >= BATCH_SIZE:
+            Lot.objects.bulk_update(batch, ["tags"])
+            batch = []
+    if batch:
+        Lot.objects.bulk_update(batch, ["tags"])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("lots", "0013_tag_trigram_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lot",
+            name="tags_array",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=100),
+                blank=True,
+                default=list,
+                size=None,
+            ),
+        ),
+        migrations.RunPython(csv_to_array, array_to_csv),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+DROP_TRIGGER_SQL = "DROP TRIGGER IF EXISTS lots_lot_search_vector_trigger ON lots_lot;"
+
+# теги теперь массив: в tsvector попадают через array_to_string
+CREATE_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION lots_lot_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', array_to_string(NEW.tags, ' ')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(NEW.category, '')), 'C') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER lots_lot_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, tags, category, description ON lots_lot
+    FOR EACH ROW EXECUTE FUNCTION lots_lot_search_vector_update();
+"""
+
+CREATE_CSV_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION lots_lot_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', replace(coalesce(NEW.tags, ''), ',', ' ')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(NEW.category, '')), 'C') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER lots_lot_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, tags, category, description ON lots_lot
+    FOR EACH ROW EXECUTE FUNCTION lots_lot_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0014_lot_tags_array"),
+    ]
+
+    operations = [
+        # триггер ссылается на колонку tags, без этого DROP COLUMN ... CASCADE удалит его молча
+        migrations.RunSQL(DROP_TRIGGER_SQL, CREATE_CSV_TRIGGER_SQL),
+        migrations.RemoveField(
+            model_name="lot",
+            name="tags",
+        ),
+        migrations.RenameField(
+            model_name="lot",
+            old_name="tags_array",
+            new_name="tags",
+        ),
+        migrations.AlterField(
+            model_name="lot",
+            name="tags",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=100),
+                blank=True,
+                default=list,
+                help_text="Введите теги через запятую",
+                size=None,
+                verbose_name="Теги",
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER_SQL, DROP_TRIGGER_SQL),
+        migrations.AddIndex(
+            model_name="lot",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tags"], name="lot_tags_gin"
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # индексы строятся без блокировки записи в таблицу лотов
+    atomic = False
+
+    dependencies = [
+        ("lots", "0015_lot_tags_swap"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="lot",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["created_at", "id"],
+                name="lot_active_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="lot",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["price", "id"],
+                name="lot_active_price_idx",
+            ),
+        ),
+    ]
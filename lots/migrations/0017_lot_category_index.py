@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("lots", "0016_lot_keyset_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="lot",
+            index=models.Index(
+                django.db.models.functions.text.Upper("category"),
+                models.F("created_at"),
+                models.F("id"),
+                condition=models.Q(("is_active", True)),
+                name="lot_active_category_idx",
+            ),
+        ),
+    ]
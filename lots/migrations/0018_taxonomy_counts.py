@@ -0,0 +1,79 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, F, Func
+
+
+def fill_counts(apps, schema_editor):
+    Lot = apps.get_model("lots", "Lot")
+    Category = apps.get_model("lots", "Category")
+    Tag = apps.get_model("lots", "Tag")
+    active = Lot.objects.filter(is_active=True)
+
+    categories = (
+        active.exclude(category="").values_list("category").annotate(n=Count("id"))
+    )
+    Category.objects.bulk_create(
+        [Category(name=name, lot_count=n) for name, n in categories], batch_size=1000
+    )
+
+    tags = (
+        active.annotate(tag=Func(F("tags"), function="unnest"))
+        .values("tag")
+        .annotate(n=Count("id"))
+        .values_list("tag", "n")
+    )
+    Tag.objects.bulk_create(
+        [Tag(name=name, lot_count=n) for name, n in tags],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["name"],
+        update_fields=["lot_count"],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0017_lot_category_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Category",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=100, unique=True, verbose_name="Категория"
+                    ),
+                ),
+                (
+                    "lot_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Активных лотов"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Категория",
+                "verbose_name_plural": "Категории",
+                "ordering": ["-lot_count", "name"],
+            },
+        ),
+        migrations.AddField(
+            model_name="tag",
+            name="lot_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Активных лотов"),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
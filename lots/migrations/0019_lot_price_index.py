@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("lots", "0018_taxonomy_counts"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="lot",
+            index=models.Index(fields=["price"], name="lot_price_idx"),
+        ),
+    ]
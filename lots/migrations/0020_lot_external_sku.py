@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0019_lot_price_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lot",
+            name="external_sku",
+            field=models.CharField(
+                blank=True,
+                max_length=100,
+                null=True,
+                unique=True,
+                verbose_name="Внешний артикул",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import bisect
+from collections import Counter
+
+from django.db import migrations, models
+
+# границы диапазонов на момент миграции (lots.facets.PRICE_BOUNDS)
+PRICE_BOUNDS = [1_000, 5_000, 10_000, 50_000, 100_000, 500_000]
+
+
+def fill_counts(apps, schema_editor):
+    Lot = apps.get_model("lots", "Lot")
+    PriceBucket = apps.get_model("lots", "PriceBucket")
+    prices = Lot.objects.filter(is_active=True).values_list("price", flat=True)
+    counts = Counter(
+        bisect.bisect_right(PRICE_BOUNDS, price) for price in prices.iterator()
+    )
+    PriceBucket.objects.bulk_create(
+        [PriceBucket(bucket=bucket, lot_count=n) for bucket, n in counts.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lots", "0020_lot_external_sku"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.PositiveSmallIntegerField(
+                        unique=True, verbose_name="Диапазон"
+                    ),
+                ),
+                (
+                    "lot_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Активных лотов"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ценовой диапазон",
+                "verbose_name_plural": "Ценовые диапазоны",
+                "ordering": ["bucket"],
+            },
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
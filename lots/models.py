@@ -1,30 +1,177 @@
-import os
 import re
-from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Upper
 from django.utils import timezone
 from django.utils.html import mark_safe
-from .utils.images import process_image, compress_and_save_pair
+from django_cleanup import cleanup
+from .tasks import schedule_renditions
+from .thumbnails import thumbnail_url
+from .tracking import ChangeTrackingMixin
+from .utils.images import Rendition, RenditionSet, release_files, rendition_names, validate_image_budget
 
 
-class Lot(models.Model):
+class ImageStatus(models.TextChoices):
+    PENDING = "pending", "В обработке"
+    READY = "ready", "Готово"
+    FAILED = "failed", "Ошибка обработки"
+
+
+def image_replaced(instance, source_field):
+    # сравнение с именем файла, загруженным вместе с объектом, — без запроса к БД
+    if instance._state.adding:
+        return bool(getattr(instance, source_field))
+    return instance.has_changed(source_field)
+
+
+def old_image(instance, source_field):
+    """Прежние фото и версии — чтобы освободить их файлы; None у нового объекта"""
+    return instance.previous(source_field, "preview_image", "renditions")
+
+
+def reset_renditions(instance, source_field):
+    """Старые версии и метаданные больше не соответствуют фото; новое сожмёт фоновый воркер"""
+    instance.preview_image = None
+    instance.renditions = []
+    instance.image_width = instance.image_height = instance.image_bytes = None
+    instance.image_color = ""
+    instance.image_hash = ""
+    instance.image_status = ImageStatus.PENDING if getattr(instance, source_field) else ImageStatus.READY
+
+
+def after_image_replaced(instance, source_field, old):
+    if old is not None:
+        # файлы могут быть общими с другими лотами, поэтому удаляются только неиспользуемые
+        names = rendition_names(old, source_field)
+        transaction.on_commit(lambda: release_files(type(instance), source_field, names))
+    if getattr(instance, source_field):
+        schedule_renditions(instance, source_field)
+
+
+class Category(models.Model):
+    """Категории с числом активных лотов — меню каталога без подсчёта по всем лотам"""
+    name = models.CharField("Категория", max_length=100, unique=True)
+    lot_count = models.PositiveIntegerField("Активных лотов", default=0)
+
+    class Meta:
+        ordering = ["-lot_count", "name"]
+        verbose_name = "Категория"
+        verbose_name_plural = "Категории"
+
+    def __str__(self):
+        return self.name
+
+
+class Tag(models.Model):
+    """Словарь нормализованных тегов: нечёткий поиск и подсказка «Возможно, вы имели в виду»"""
+    name = models.CharField("Тег", max_length=255, unique=True)
+    # поддерживается lots.taxonomy при сохранении и удалении лотов
+    lot_count = models.PositiveIntegerField("Активных лотов", default=0)
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name = "Тег"
+        verbose_name_plural = "Теги"
+        indexes = [
+            GinIndex(fields=["name"], name="tag_name_trgm", opclasses=["gin_trgm_ops"]),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def register(cls, names):
+        # один INSERT на все теги лота, уже известные пропускаются
+        cls.objects.bulk_create([cls(name=name) for name in names], ignore_conflicts=True)
+
+
+class PriceBucket(models.Model):
+    """
+    Число активных лотов в ценовых диапазонах фасета: номер — как у width_bucket по
+    lots.facets.PRICE_BOUNDS. После смены границ счётчики пересчитывает lots.taxonomy.rebuild()
+    """
+    bucket = models.PositiveSmallIntegerField("Диапазон", unique=True)
+    lot_count = models.PositiveIntegerField("Активных лотов", default=0)
+
+    class Meta:
+        ordering = ["bucket"]
+        verbose_name = "Ценовой диапазон"
+        verbose_name_plural = "Ценовые диапазоны"
+
+    def __str__(self):
+        return str(self.bucket)
+
+
+# файлы версий адресуются по содержимому и бывают общими у нескольких строк,
+# поэтому их удаление выполняет release_files, а не django_cleanup
+@cleanup.ignore
+class Lot(ChangeTrackingMixin, models.Model):
     title = models.CharField("Название", max_length=255)
     price = models.IntegerField(verbose_name="Цена", help_text="Укажите цену")
     description = models.TextField("Описание", blank=True)
 
-    main_image = models.ImageField("Основное изображение", upload_to="lots/images/", blank=True, null=True)
+    main_image = models.ImageField("Основное изображение", upload_to="lots/images/", blank=True, null=True,
+                                   validators=[validate_image_budget])
     preview_image = models.ImageField("Превью для списка", upload_to="lots/previews/", blank=True, null=True,
                                       editable=False)
+    image_status = models.CharField("Статус изображения", max_length=10, choices=ImageStatus.choices,
+                                    default=ImageStatus.READY, editable=False)
+    renditions = models.JSONField("Доп. версии изображения", default=list, blank=True, editable=False)
+    image_width = models.PositiveIntegerField("Ширина изображения", null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField("Высота изображения", null=True, blank=True, editable=False)
+    image_bytes = models.PositiveIntegerField("Размер изображения, байт", null=True, blank=True, editable=False)
+    image_color = models.CharField("Основной цвет", max_length=7, blank=True, editable=False)
+    image_hash = models.CharField("Хэш исходника", max_length=32, blank=True, db_index=True, editable=False)
     created_at = models.DateTimeField("Дата создания", default=timezone.now)
     updated_at = models.DateTimeField("Обновлён", auto_now=True)
     is_active = models.BooleanField("Активен", default=True)
     category = models.CharField("Категория", max_length=100, blank=True, help_text="Например: Иконы, Живопись")
-    tags = models.CharField("Теги (через запятую)", max_length=255, blank=True,
-                            help_text="Введите теги через запятую")
+    tags = ArrayField(models.CharField(max_length=100), verbose_name="Теги", blank=True, default=list,
+                      help_text="Введите теги через запятую")
+    # артикул из внешнего учёта: по нему повторный импорт обновляет лот, а не создаёт копию
+    external_sku = models.CharField("Внешний артикул", max_length=100, unique=True, null=True, blank=True)
+    # заполняется триггером в БД (см. миграцию 0012) из названия, тегов, категории и описания
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    RENDITIONS = {
+        "main_image": RenditionSet(
+            Rendition(2560, quality=90, field="main_image"),
+            Rendition(1280),
+            Rendition(800, quality=75, field="preview_image"),
+            Rendition(400, quality=75),
+            Rendition(1280, "WEBP", quality=80),
+            Rendition(800, "WEBP", quality=75),
+            Rendition(400, "WEBP", quality=75),
+            Rendition(1280, "AVIF", quality=60),
+            Rendition(800, "AVIF", quality=55),
+            Rendition(400, "AVIF", quality=55),
+            upload_to="lots/renditions/",
+        ),
+    }
 
     class Meta:
         ordering = ["-created_at"]
         verbose_name = "Лот"
         verbose_name_plural = "Лоты"
+        indexes = [
+            GinIndex(fields=["search_vector"], name="lot_search_vector_gin"),
+            GinIndex(fields=["title"], name="lot_title_trgm", opclasses=["gin_trgm_ops"]),
+            # точное совпадение и пересечение тегов: tags @> / &&
+            GinIndex(fields=["tags"], name="lot_tags_gin"),
+            # постраничный вывод по курсору: (ключ сортировки, id) среди активных лотов,
+            # обратный обход индекса покрывает и убывающую сортировку
+            models.Index(fields=["created_at", "id"], condition=models.Q(is_active=True),
+                         name="lot_active_created_idx"),
+            models.Index(fields=["price", "id"], condition=models.Q(is_active=True),
+                         name="lot_active_price_idx"),
+            # диапазоны цены в админке (включая неактивные лоты) и квантили для их границ
+            models.Index(fields=["price"], name="lot_price_idx"),
+            # ?category= — это category__iexact, т.е. UPPER(category) = UPPER(...), с сортировкой по дате
+            models.Index(Upper("category"), "created_at", "id", condition=models.Q(is_active=True),
+                         name="lot_active_category_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -33,12 +180,12 @@ class Lot(models.Model):
     def normalize_tags(self):
         result = []
 
-        for t in self.tags.split(","):
+        for t in self.tags:
             t = re.sub(r"\s+", " ", t.strip().lower())
             if t and t not in result:
                 result.append(t)
 
-        return ", ".join(result)
+        return result
 
     # Нормализация категории
     def normalize_category(self):
@@ -55,38 +202,75 @@ class Lot(models.Model):
         if self.category:
             self.category = self.normalize_category()
 
-        if self.main_image:
-            is_new = not self.pk or Lot.objects.filter(pk=self.pk).exclude(main_image=self.main_image).exists()
-            if is_new:
-                compress_and_save_pair(self, self.main_image, self.preview_image)
+        replaced = image_replaced(self, "main_image")
+        if replaced:
+            old = old_image(self, "main_image")
+            reset_renditions(self, "main_image")
+        tags_changed = self.tags and self.has_changed("tags")
 
         super().save(*args, **kwargs)
 
+        if tags_changed:
+            Tag.register(self.tags)
+
+        if replaced:
+            after_image_replaced(self, "main_image", old)
+
     def tags_list(self):
-        return [t.strip() for t in self.tags.split(",") if t.strip()]
+        return self.tags
 
     def image_preview(self):
         # в админке показываем маленькое превью, чтобы она работала быстро
-        display_img = self.preview_image if self.preview_image else self.main_image
-        if display_img:
-            return mark_safe(f'<img src="{display_img.url}" style="max-height:100px;"/>')
+        if self.image_status == ImageStatus.PENDING:
+            return "(Обрабатывается)"
+        if self.main_image:
+            # миниатюра под размер ячейки вместо 800px превью
+            return mark_safe(f'<img src="{thumbnail_url(self.main_image.name, 200, 200)}" style="max-height:100px;"/>')
         return "(Нет изображения)"
 
     image_preview.short_description = "Превью"
 
 
-class LotImage(models.Model):
+@cleanup.ignore
+class LotImage(ChangeTrackingMixin, models.Model):
     lot = models.ForeignKey(Lot, on_delete=models.CASCADE, related_name="images")
-    image = models.ImageField("Доп. фото", upload_to="lots/gallery/")
+    image = models.ImageField("Доп. фото", upload_to="lots/gallery/", validators=[validate_image_budget])
     preview_image = models.ImageField("Доп. фото (превью)", upload_to="lots/gallery_previews/", editable=False, blank=True, null=True)
+    image_status = models.CharField("Статус изображения", max_length=10, choices=ImageStatus.choices,
+                                    default=ImageStatus.READY, editable=False)
+    renditions = models.JSONField("Доп. версии изображения", default=list, blank=True, editable=False)
+    image_width = models.PositiveIntegerField("Ширина изображения", null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField("Высота изображения", null=True, blank=True, editable=False)
+    image_bytes = models.PositiveIntegerField("Размер изображения, байт", null=True, blank=True, editable=False)
+    image_color = models.CharField("Основной цвет", max_length=7, blank=True, editable=False)
+    image_hash = models.CharField("Хэш исходника", max_length=32, blank=True, db_index=True, editable=False)
+
+    RENDITIONS = {
+        "image": RenditionSet(
+            Rendition(2560, quality=90, field="image"),
+            Rendition(800, quality=75, field="preview_image"),
+            Rendition(400, quality=75),
+            Rendition(200, quality=75),
+            Rendition(800, "WEBP", quality=75),
+            Rendition(400, "WEBP", quality=75),
+            Rendition(200, "WEBP", quality=75),
+            Rendition(800, "AVIF", quality=55),
+            Rendition(400, "AVIF", quality=55),
+            Rendition(200, "AVIF", quality=55),
+            upload_to="lots/gallery_renditions/",
+        ),
+    }
 
     def save(self, *args, **kwargs):
-        if self.image:
-            is_new = not self.pk or LotImage.objects.filter(pk=self.pk).exclude(image=self.image).exists()
-            if is_new:
-                compress_and_save_pair(self, self.image, self.preview_image)
+        replaced = image_replaced(self, "image")
+        if replaced:
+            old = old_image(self, "image")
+            reset_renditions(self, "image")
 
         super().save(*args, **kwargs)
 
+        if replaced:
+            after_image_replaced(self, "image", old)
+
     def __str__(self):
         return f"Image for {self.lot.title}"
\ No newline at end of file
@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import taxonomy
+from .caching import bump_catalogue_version, bump_version
+from .models import Lot, LotImage
+from .utils.images import release_files, rendition_names
+
+
+@receiver(post_delete, sender=Lot)
+@receiver(post_delete, sender=LotImage)
+def delete_renditions(sender, instance, **kwargs):
+    # файлы общие для одинаковых загрузок: удаляются, только если на них больше никто не ссылается
+    source_field = next(iter(sender.RENDITIONS))
+    names = rendition_names(instance, source_field)
+    if names:
+        transaction.on_commit(lambda: release_files(sender, source_field, names))
+
+
+# счётчики категорий и тегов меню обновляются на изменение одного лота, без пересчёта каталога
+@receiver(pre_save, sender=Lot)
+def remember_taxonomy(sender, instance, update_fields=None, **kwargs):
+    taxonomy.lot_saving(instance, update_fields)
+
+
+@receiver(post_save, sender=Lot)
+def update_taxonomy(sender, instance, created, update_fields=None, **kwargs):
+    taxonomy.lot_saved(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=Lot)
+def release_taxonomy(sender, instance, **kwargs):
+    taxonomy.lot_deleted(instance)
+
+
+# любое изменение лота или его фото делает устаревшими закэшированные страницы каталога
+@receiver(post_save, sender=Lot)
+@receiver(post_save, sender=LotImage)
+@receiver(post_delete, sender=Lot)
+@receiver(post_delete, sender=LotImage)
+def invalidate_catalogue(sender, **kwargs):
+    bump_catalogue_version()
+
+
+# страница лота показывает и галерею: её правка должна менять Last-Modified лота
+@receiver(post_save, sender=LotImage)
+@receiver(post_delete, sender=LotImage)
+def touch_lot(sender, instance, **kwargs):
+    Lot.objects.filter(pk=instance.lot_id).update(updated_at=timezone.now())
+
+
+# выкладка (migrate) может менять шаблоны: закэшированные страницы и ETag сбрасываются
+@receiver(post_migrate)
+def invalidate_after_migrate(sender, **kwargs):
+    if sender.name == "lots":
+        bump_version()
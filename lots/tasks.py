@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from redis import Redis
+from redis.exceptions import RedisError
+
+from .caching import bump_catalogue_version
+from .utils.images import release_files, rendition_names, save_renditions
+
+logger = logging.getLogger(__name__)
+
+# очередь задач и список задач, взятых воркером в работу
+QUEUE_KEY = "lots:renditions"
+PROCESSING_KEY = "lots:renditions:processing"
+
+_redis_client = None
+
+# задачи, накопленные внутри batched_renditions() в текущем потоке
+_batch = threading.local()
+
+
+def get_redis():
+    """Ленивый клиент Redis, чтобы модуль импортировался и без REDIS_URL"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis_client
+
+
+def schedule_renditions(instance, image_field):
+    """
+    Ставит пересборку изображения в очередь после коммита транзакции.
+    Без Redis (локальная разработка) обработка выполняется сразу
+    """
+    job = {
+        "model": instance._meta.label_lower,
+        "pk": instance.pk,
+        "field": image_field,
+        "name": getattr(instance, image_field).name,
+    }
+    jobs = getattr(_batch, "jobs", None)
+    if jobs is not None:
+        jobs.append(job)
+    else:
+        transaction.on_commit(lambda: enqueue(job))
+
+
+@contextmanager
+def batched_renditions():
+    """
+    Все задачи, запланированные внутри блока, ставятся в очередь одним запросом к Redis,
+    а без Redis обрабатываются параллельно. Используется при сохранении лота с галереей в админке
+    """
+    if getattr(_batch, "jobs", None) is not None:
+        yield
+        return
+
+    _batch.jobs = jobs = []
+    try:
+        yield
+    finally:
+        del _batch.jobs
+    if jobs:
+        transaction.on_commit(lambda: enqueue_many(jobs))
+
+
+def enqueue(job):
+    enqueue_many([job])
+
+
+def enqueue_many(jobs):
+    if not settings.REDIS_URL:
+        return process_jobs(jobs)
+
+    try:
+        get_redis().lpush(QUEUE_KEY, *(json.dumps(job) for job in jobs))
+    except RedisError as e:
+        # очередь недоступна: лучше медленно обработать сейчас, чем оставить фото в статусе pending
+        logger.warning("Очередь изображений недоступна (%s), обрабатываем синхронно", e)
+        process_jobs(jobs)
+
+
+def process_jobs(jobs):
+    """
+    Синхронная обработка нескольких задач в потоках: Pillow отпускает GIL при декодировании
+    и кодировании, поэтому время ожидания близко ко времени самого большого фото
+    """
+    if len(jobs) == 1:
+        return [process_job(jobs[0])]
+    with ThreadPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+        return list(pool.map(process_job_in_thread, jobs))
+
+
+def process_job_in_thread(job):
+    try:
+        return process_job(job)
+    finally:
+        # у каждого потока своё соединение с БД, его нужно закрыть вместе с потоком
+        connections.close_all()
+
+
+def pop_job(timeout=5):
+    """Атомарно переносит задачу из очереди в список обрабатываемых"""
+    return get_redis().blmove(QUEUE_KEY, PROCESSING_KEY, timeout, "RIGHT", "LEFT")
+
+
+def ack_job(raw):
+    get_redis().lrem(PROCESSING_KEY, 1, raw)
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задачи, которые не успел завершить упавший воркер"""
+    client = get_redis()
+    count = 0
+    while client.lmove(PROCESSING_KEY, QUEUE_KEY, "RIGHT", "RIGHT"):
+        count += 1
+    return count
+
+
+def run_job(raw):
+    """
+    Точка входа для процессов воркера.
+    Возвращает статус, время и пиковый RSS процесса, чтобы расход памяти был виден в логах
+    """
+    started = time.monotonic()
+    status = process_job(json.loads(raw))
+    # ru_maxrss в Linux — в килобайтах
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return f"{status or 'skipped'} за {time.monotonic() - started:.1f} с, пик RSS {peak_mb:.0f} МБ"
+
+
+def process_job(job):
+    if job.get("task") == "import_lots":
+        # importer сам импортирует этот модуль
+        from .importer import run_staged_import
+        return run_staged_import(job)
+
+    model = apps.get_model(job["model"])
+    instance = model.objects.filter(pk=job["pk"]).first()
+    if instance is None:
+        return None
+
+    image = getattr(instance, job["field"])
+
+    # пока задача ждала в очереди, фото успели заменить — у новой будет своя задача
+    if image.name != job["name"]:
+        return None
+
+    old_names = rendition_names(instance, job["field"])
+    updates = {}
+    try:
+        for name in save_renditions(instance, job["field"]):
+            updates[name] = getattr(instance, name)
+        status = "ready"
+    except Exception:
+        logger.exception("Ошибка при обработке %s #%s", job["model"], job["pk"])
+        status = "failed"
+        updates = {}
+
+    if hasattr(instance, "image_status"):
+        updates["image_status"] = status
+    if hasattr(instance, "updated_at"):
+        updates["updated_at"] = timezone.now()
+
+    new_names = rendition_names(instance, job["field"])
+
+    updated = model.objects.filter(pk=instance.pk, **{job["field"]: job["name"]}).update(**updates)
+    if not updated or status == "failed":
+        # в БД ничего не записали — освобождаем только что созданные (или взятые у другого лота) файлы
+        release_files(model, job["field"], new_names - old_names)
+        return status if updated else None
+
+    # заменённые файлы: исходная загрузка и, при повторной обработке, прежние версии
+    release_files(model, job["field"], old_names - new_names)
+
+    # фото галереи — часть страницы лота: её Last-Modified тоже должен смениться
+    lot_id = getattr(instance, "lot_id", None)
+    if lot_id:
+        apps.get_model("lots", "Lot").objects.filter(pk=lot_id).update(updated_at=timezone.now())
+
+    # готовые версии фото меняют разметку страниц, а update() сигналов не шлёт
+    bump_catalogue_version()
+
+    return status
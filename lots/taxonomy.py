@@ -0,0 +1,135 @@
+from collections import Counter
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, F, Func
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .caching import bump_catalogue_version
+from .facets import price_bucket
+
+# поля лота, от которых зависят счётчики категорий, тегов и ценовых диапазонов
+TAXONOMY_FIELDS = {"is_active", "category", "tags", "price"}
+
+EMPTY = ("", frozenset(), None)
+
+
+def taxonomy_state(lot):
+    """Категория, теги и ценовой диапазон, которые лот вносит в счётчики: неактивный лот не вносит ничего"""
+    if not lot.is_active:
+        return EMPTY
+    return lot.category, frozenset(lot.tags), price_bucket(lot.price)
+
+
+def category_counts(queryset):
+    return dict(queryset.exclude(category="").values_list("category").annotate(n=Count("id")))
+
+
+def tag_counts(queryset):
+    return dict(
+        queryset.annotate(tag=Func(F("tags"), function="unnest"))
+        .values("tag")
+        .annotate(n=Count("id"))
+        .values_list("tag", "n")
+    )
+
+
+def bucket_counts(queryset):
+    # границы диапазонов — в Python, как и при сохранении лота
+    return Counter(price_bucket(price) for price in queryset.values_list("price", flat=True).iterator())
+
+
+def adjust(model, deltas, key="name"):
+    """Сдвигает lot_count на delta; отсутствующие ключи создаются"""
+    deltas = {name: delta for name, delta in deltas.items() if name not in ("", None) and delta}
+    if not deltas:
+        return
+    model.objects.bulk_create([model(**{key: name}) for name, delta in deltas.items() if delta > 0],
+                              ignore_conflicts=True)
+    # одно UPDATE на каждое значение сдвига: при сохранении лота это +1 и -1
+    for delta in set(deltas.values()):
+        names = [name for name, d in deltas.items() if d == delta]
+        model.objects.filter(**{f"{key}__in": names}).update(lot_count=Greatest(F("lot_count") + delta, 0))
+
+
+def apply_change(old, new):
+    Category = apps.get_model("lots", "Category")
+    Tag = apps.get_model("lots", "Tag")
+    PriceBucket = apps.get_model("lots", "PriceBucket")
+    (old_category, old_tags, old_bucket), (new_category, new_tags, new_bucket) = old, new
+
+    if old_category != new_category:
+        adjust(Category, {old_category: -1, new_category: 1})
+    adjust(Tag, {**{t: -1 for t in old_tags - new_tags}, **{t: 1 for t in new_tags - old_tags}})
+    if old_bucket != new_bucket:
+        adjust(PriceBucket, {old_bucket: -1, new_bucket: 1}, key="bucket")
+
+
+def touches_taxonomy(update_fields):
+    return update_fields is None or not TAXONOMY_FIELDS.isdisjoint(update_fields)
+
+
+def lot_saving(lot, update_fields=None):
+    """
+    pre_save: прежнее состояние — из значений, загруженных вместе с лотом;
+    если лот загружен без нужных полей, они берутся из БД до записи
+    """
+    if lot._state.adding or not touches_taxonomy(update_fields):
+        return
+    lot._taxonomy = taxonomy_state(lot.previous(*TAXONOMY_FIELDS))
+
+
+def lot_saved(lot, created, update_fields=None):
+    if not touches_taxonomy(update_fields):
+        return
+    old = EMPTY if created else lot._taxonomy
+    new = taxonomy_state(lot)
+    if old != new:
+        apply_change(old, new)
+
+
+def lot_deleted(lot):
+    apply_change(taxonomy_state(lot.previous(*TAXONOMY_FIELDS)), EMPTY)
+
+
+def set_active(queryset, active):
+    """
+    Массовая публикация/снятие лотов (действия админки): счётчики сдвигаются
+    на агрегаты по затронутым строкам, а не пересчитываются по всему каталогу
+    """
+    Category = apps.get_model("lots", "Category")
+    Tag = apps.get_model("lots", "Tag")
+    PriceBucket = apps.get_model("lots", "PriceBucket")
+    sign = 1 if active else -1
+
+    with transaction.atomic():
+        changed = queryset.filter(is_active=not active)
+        categories = category_counts(changed)
+        tags = tag_counts(changed)
+        buckets = bucket_counts(changed)
+        count = changed.update(is_active=active, updated_at=timezone.now())
+        adjust(Category, {name: sign * n for name, n in categories.items()})
+        adjust(Tag, {name: sign * n for name, n in tags.items()})
+        adjust(PriceBucket, {bucket: sign * n for bucket, n in buckets.items()}, key="bucket")
+        # update() в обход save(): сигналы не срабатывают
+        bump_catalogue_version()
+    return count
+
+
+def rebuild():
+    """Полный пересчёт: после массовых операций в обход save() (импорт, update())"""
+    Lot = apps.get_model("lots", "Lot")
+    active = Lot.objects.filter(is_active=True)
+
+    with transaction.atomic():
+        for model, key, counts in (
+            (apps.get_model("lots", "Category"), "name", category_counts(active)),
+            (apps.get_model("lots", "Tag"), "name", tag_counts(active)),
+            (apps.get_model("lots", "PriceBucket"), "bucket", bucket_counts(active)),
+        ):
+            model.objects.filter(lot_count__gt=0).update(lot_count=0)
+            model.objects.bulk_create(
+                [model(**{key: name}, lot_count=n) for name, n in counts.items()],
+                update_conflicts=True, unique_fields=[key], update_fields=["lot_count"],
+            )
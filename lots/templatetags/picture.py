@@ -0,0 +1,85 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from lots import thumbnails
+from lots.utils.images import MIME_TYPES
+
+register = template.Library()
+
+# современные форматы идут первыми: браузер берёт первый поддерживаемый <source>
+SOURCE_FORMATS = ("avif", "webp")
+
+
+def build_srcset(storage, items):
+    return ", ".join(f"{storage.url(item['name'])} {item['width']}w" for item in items)
+
+
+@register.simple_tag
+def picture(obj, sizes, alt="", css_class="", style="", loading="lazy"):
+    """
+    <picture> с AVIF/WebP и JPEG-фолбэком по сохранённым версиям изображения.
+    Все размеры берутся из obj.renditions, к хранилищу обращений нет.
+    Использование: {% picture lot "(min-width: 768px) 33vw, 100vw" alt=lot.title %}
+    """
+    source_field = next(iter(obj.RENDITIONS))
+    image = getattr(obj, source_field)
+    if not image:
+        return ""
+
+    storage = image.storage
+    preview = getattr(obj, "preview_image", None)
+    fallback = preview if preview else image
+
+    by_format = {}
+    for item in sorted(obj.renditions or [], key=lambda i: i["width"]):
+        by_format.setdefault(item["format"], []).append(item)
+
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[fmt], build_srcset(storage, by_format[fmt]), sizes)
+            for fmt in SOURCE_FORMATS
+            if fmt in by_format
+        ),
+    )
+
+    color = getattr(obj, "image_color", "")
+    if color:
+        # основной цвет виден, пока фото не загрузилось
+        style = f"{style.rstrip('; ')}; background-color: {color};".lstrip("; ")
+
+    img_attrs = {
+        "src": fallback.url,
+        "alt": alt,
+        "class": css_class,
+        "style": style,
+        "loading": loading,
+        "decoding": "async",
+    }
+    if "jpeg" in by_format:
+        img_attrs["srcset"] = build_srcset(storage, by_format["jpeg"])
+        img_attrs["sizes"] = sizes
+    if getattr(obj, "image_width", None):
+        # размеры оригинала задают пропорции, место под фото резервируется до загрузки
+        img_attrs["width"] = obj.image_width
+        img_attrs["height"] = obj.image_height
+    if loading == "eager":
+        img_attrs["fetchpriority"] = "high"
+
+    img = format_html(
+        "<img {}>",
+        format_html_join(" ", '{}="{}"', ((k, v) for k, v in img_attrs.items() if v not in ("", None))),
+    )
+    return format_html("<picture>{}{}</picture>", sources, img)
+
+
+@register.simple_tag
+def thumbnail_url(image, width, height):
+    """
+    Подписанный URL миниатюры, вписанной в width x height.
+    Использование: <img src="{% thumbnail_url lot.main_image 300 300 %}">
+    """
+    if not image:
+        return ""
+    return thumbnails.thumbnail_url(image.name, int(width), int(height))
@@ -1,3 +1,730 @@
-from django.test import TestCase
+import copy
+import io
+import os
+import random
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .management.commands.rebuild_renditions import Command as RebuildRenditions
+from .api import DEFAULT_FIELDS
+from .caching import card_key, catalogue_version, render_cards
+from .facets import catalogue_facets, facet_counts, get_facets, normalize_filter
+from .importer import LotImporter, process_images
+from .thumbnails import thumbnail_url
+from .models import Category, ImageStatus, Lot, LotImage, PriceBucket, Tag
+from .pagination import KeysetPaginator
+from .views import LotListView
+
+SYLLABLES = ["ба", "ве", "го", "да", "ке", "ло", "ми", "но", "пу", "ра", "си", "ту", "фе", "ха", "чи", "ша"]
+
+
+def make_words(rnd, count, length):
+    words = set()
+    while len(words) < count:
+        words.add("".join(rnd.choice(SYLLABLES) for _ in range(length)))
+    return sorted(words)
+
+
+@skipUnless(connection.vendor == "postgresql", "планы запросов проверяются только на PostgreSQL")
+class CatalogueQueryPlanTests(TestCase):
+    """
+    Наполняет каталог синтетическими лотами и проверяет через EXPLAIN,
+    что ни один публичный запрос не читает таблицы лотов целиком
+    """
+    LOTS = 20_000
+    TABLES = ("lots_lot", "lots_lotimage")
+    # чтение, в том числе с CTE (фасеты), — через EXPLAIN; управление транзакцией и оценка
+    # числа строк планировщиком (EXPLAIN без выполнения) таблиц не читают
+    READ_PREFIXES = ("SELECT", "WITH")
+    SKIPPED_PREFIXES = ("EXPLAIN", "SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT", "BEGIN", "COMMIT")
+
+    @classmethod
+    def setUpTestData(cls):
+        rnd = random.Random(0)
+        cls.words = make_words(rnd, 2000, 4)
+        cls.tags = make_words(rnd, 300, 3)
+        cls.categories = [w.capitalize() for w in make_words(rnd, 40, 2)]
+        now = timezone.now()
+
+        lots = [
+            Lot(
+                title=" ".join(rnd.sample(cls.words, 3)),
+                description=" ".join(rnd.sample(cls.words, 20)),
+                price=rnd.randint(100, 1_000_000),
+                category=rnd.choice(cls.categories),
+                tags=rnd.sample(cls.tags, 3),
+                is_active=rnd.random() > 0.05,
+                created_at=now - timedelta(minutes=rnd.randint(0, 5_000_000)),
+            )
+            for _ in range(cls.LOTS)
+        ]
+        Lot.objects.bulk_create(lots, batch_size=2000)
+        cls.lot = Lot.objects.filter(is_active=True).first()
+        LotImage.objects.bulk_create([
+            LotImage(lot=lot, image=f"lots/gallery/{lot.pk}_{i}.jpg")
+            for lot in lots[:5000] for i in range(2)
+        ], batch_size=2000)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE lots_lot")
+            cursor.execute("ANALYZE lots_lotimage")
+
+    def setUp(self):
+        # страницы из кэша не выполняют запросов, проверять было бы нечего
+        cache.clear()
+
+    def assertNoSeqScan(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+        queries = []
+        for query in ctx.captured_queries:
+            sql = query["sql"].lstrip()
+            if sql.upper().startswith(self.READ_PREFIXES):
+                queries.append(sql)
+            else:
+                # запрос, который не проверен через EXPLAIN, не должен пройти незаметно
+                self.assertTrue(sql.upper().startswith(self.SKIPPED_PREFIXES), f"{url}\nне проверен: {sql}")
+        self.assertTrue(queries, url)
+        for sql in queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN {sql}")
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            for table in self.TABLES:
+                self.assertNotIn(f"Seq Scan on {table}", plan, f"{url}\n{sql}\n{plan}")
+        return response
+
+    def test_list_sorts(self):
+        for sort in ("", "-created_at", "oldest", "price_asc", "price_desc"):
+            with self.subTest(sort=sort):
+                self.assertNoSeqScan(f"{reverse('lots:lot_list')}?sort={sort}")
+
+    def test_next_page(self):
+        for sort in ("-created_at", "price_asc"):
+            with self.subTest(sort=sort):
+                response = self.assertNoSeqScan(f"{reverse('lots:lot_list')}?sort={sort}")
+                cursor = response.context["page_obj"].next_cursor
+                self.assertNoSeqScan(f"{reverse('lots:lot_list')}?sort={sort}&cursor={cursor}")
+
+    def test_filters(self):
+        category = self.categories[0]
+        tags = self.tags[:2]
+        for query in (
+            f"category={category}",
+            f"category={category.lower()}&sort=price_asc",
+            f"tag={tags[0]}",
+            f"tag={tags[0]}&tag={tags[1]}",
+            f"any_tag={tags[0]}&any_tag={tags[1]}",
+            "min_price=1000&max_price=4999",
+            "min_price=500000&sort=price_asc",
+        ):
+            with self.subTest(query=query):
+                self.assertNoSeqScan(f"{reverse('lots:lot_list')}?{query}")
+
+    def test_search(self):
+        word = self.words[0]
+        for query in (f"q={word}", f"q={word}&sort=price_asc", "q=несуществующееслово"):
+            with self.subTest(query=query):
+                self.assertNoSeqScan(f"{reverse('lots:lot_list')}?{query}")
+
+    def test_detail(self):
+        self.assertNoSeqScan(reverse("lots:lot_detail", args=[self.lot.pk]))
+
+    def test_api(self):
+        url = reverse("lots:api_lot_list")
+        response = self.assertNoSeqScan(f"{url}?sort=price_asc&fields=id,title,image,images,card")
+        self.assertEqual(len(response.json()["results"]), 12)
+        self.assertNoSeqScan(response.json()["next"])
+        self.assertNoSeqScan(f"{url}?tag={self.tags[0]}&fields=id")
+        self.assertNoSeqScan(reverse("lots:api_lot_detail", args=[self.lot.pk]))
+
+
+class LotAdminSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(username="admin", password="admin")
+        cls.match = Lot.objects.create(title="Оклад", price=5000, category="Иконы", tags=["шатлен"])
+        Lot.objects.create(title="Подстаканник", price=5000, category="Иконы", tags=["шатлен"], is_active=False)
+        Lot.objects.create(title="Ложка", price=5000, category="Посуда", tags=["шатлен"])
+        Lot.objects.create(title="Рама", price=900_000, category="Иконы", tags=["шатлен"])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_tag_search_keeps_list_filters(self):
+        response = self.client.get(reverse("admin:lots_lot_changelist"), {
+            "q": "Шатлен",
+            "is_active__exact": "1",
+            "category": "Иконы",
+            "price_range": "-10000",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["cl"].result_list), [self.match])
+
+    def test_tag_search_without_filters(self):
+        response = self.client.get(reverse("admin:lots_lot_changelist"), {"q": "шатлен"})
+        self.assertEqual(response.context["cl"].result_count, 4)
+
+
+class LotAdminImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(username="admin", password="admin")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        staging = tempfile.TemporaryDirectory()
+        self.addCleanup(staging.cleanup)
+        self.staging = staging.name
+
+    def test_import_runs_as_job_and_reports_progress(self):
+        manifest = SimpleUploadedFile(
+            "lots.csv",
+            "sku,title,price\nШТЛ-1,Шатлен,1500\nШТЛ-2,Без цены,\n".encode(),
+        )
+        # без Redis задача воркера выполняется сразу
+        with override_settings(IMPORT_STAGING_ROOT=self.staging, REDIS_URL=None):
+            response = self.client.post(reverse("admin:lots_lot_import"), {"manifest": manifest})
+            self.assertEqual(response.status_code, 302)
+            response = self.client.get(response.url)
+
+        status = response.context["status"]
+        self.assertEqual(status["state"], "done")
+        self.assertEqual(status["error_count"], 1)
+        self.assertTrue(response.context["finished"])
+        self.assertTrue(Lot.objects.filter(external_sku="ШТЛ-1", title="Шатлен").exists())
+        self.assertFalse(Lot.objects.filter(external_sku="ШТЛ-2").exists())
+        # файлы импорта удаляются после выполнения задачи
+        self.assertEqual(os.listdir(self.staging), [])
+
+    def test_unknown_import(self):
+        response = self.client.get(reverse("admin:lots_lot_import_status", args=["0" * 32]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ChangeTrackingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.pk = Lot.objects.create(title="Шатлен", price=1500, category="Иконы", tags=["шатлен"]).pk
+
+    def lot_updates(self, queries):
+        return [q["sql"] for q in queries if q["sql"].startswith('UPDATE "lots_lot"')]
+
+    def test_dirty_fields_after_load_and_assignment(self):
+        lot = Lot.objects.get(pk=self.pk)
+        self.assertEqual(lot.dirty_fields, set())
+
+        lot.title = "Шатлен серебряный"
+        # правка списка на месте тоже изменение
+        lot.tags.append("серебро")
+        self.assertEqual(lot.dirty_fields, {"title", "tags"})
+        self.assertTrue(lot.has_changed("title"))
+        self.assertFalse(lot.has_changed("price"))
+
+        lot.title = "Шатлен"
+        self.assertEqual(lot.dirty_fields, {"tags"})
+
+    def test_save_writes_changed_and_auto_now_fields(self):
+        lot = Lot.objects.get(pk=self.pk)
+        updated_at = lot.updated_at
+        lot.price = 2500
+        with CaptureQueriesContext(connection) as ctx:
+            lot.save()
+
+        [sql] = self.lot_updates(ctx.captured_queries)
+        self.assertIn('"price"', sql)
+        self.assertIn('"updated_at"', sql)
+        self.assertNotIn('"title"', sql)
+        self.assertEqual(lot.dirty_fields, set())
+        self.assertGreater(Lot.objects.get(pk=self.pk).updated_at, updated_at)
+
+    def test_save_without_changes_writes_nothing(self):
+        lot = Lot.objects.get(pk=self.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            lot.save()
+        self.assertEqual(self.lot_updates(ctx.captured_queries), [])
+        self.assertEqual(Lot.objects.get(pk=self.pk).updated_at, lot.updated_at)
+
+    def test_previous(self):
+        lot = Lot.objects.get(pk=self.pk)
+        lot.price = 2500
+        lot.category = "Живопись"
+        previous = lot.previous("price", "category")
+        self.assertEqual((previous.price, previous.category), (1500, "Иконы"))
+        self.assertIsNone(Lot(title="Новый", price=1).previous("price"))
+
+    def test_previous_of_deferred_field(self):
+        lot = Lot.objects.only("title").get(pk=self.pk)
+        lot.price = 2500
+        # прежнее значение незагруженного поля догружается из БД
+        with self.assertNumQueries(1):
+            self.assertEqual(lot.previous("price").price, 1500)
+
+    def test_refresh_from_db_resets_snapshot(self):
+        lot = Lot.objects.get(pk=self.pk)
+        Lot.objects.filter(pk=self.pk).update(title="Шатлен бронзовый")
+        lot.refresh_from_db()
+        self.assertEqual(lot.dirty_fields, set())
+
+        lot.title = "Шатлен"
+        self.assertEqual(lot.dirty_fields, {"title"})
+        self.assertEqual(lot.previous("title").title, "Шатлен бронзовый")
+
+    def test_copy_has_own_snapshot(self):
+        lot = Lot.objects.get(pk=self.pk)
+        duplicate = copy.copy(lot)
+        duplicate.title = "Шатлен бронзовый"
+        duplicate.save()
+
+        self.assertEqual(lot.dirty_fields, set())
+        lot.price = 2500
+        with CaptureQueriesContext(connection) as ctx:
+            lot.save()
+        [sql] = self.lot_updates(ctx.captured_queries)
+        self.assertNotIn('"title"', sql)
+        self.assertEqual(Lot.objects.get(pk=self.pk).title, "Шатлен бронзовый")
+
+
+class RebuildRenditionsWriteTests(TestCase):
+    def make_lot(self, title):
+        lot = Lot.objects.create(title=title, price=1500)
+        # без сохранения через save(): иначе фото ушло бы в обработку
+        Lot.objects.filter(pk=lot.pk).update(
+            main_image=f"lots/images/{title}.jpg",
+            preview_image=f"lots/previews/{title}.jpg",
+            renditions=[{"name": f"lots/renditions/{title}.webp", "format": "webp", "width": 400, "height": 300}],
+            image_hash=title * 8,
+            image_width=2000,
+        )
+        return Lot.objects.get(pk=lot.pk)
+
+    def test_rows_changing_different_fields(self):
+        first, second, unchanged = self.make_lot("aaaa"), self.make_lot("bbbb"), self.make_lot("cccc")
+        RebuildRenditions().write_results("lot", [
+            (first.pk, {"image_hash": "d" * 32}, []),
+            (second.pk, {"preview_image": "lots/previews/new.jpg"}, []),
+            # строка, взявшая версии у самой себя
+            (unchanged.pk, {}, []),
+        ])
+
+        first.refresh_from_db()
+        self.assertEqual(first.image_hash, "d" * 32)
+        self.assertEqual(first.preview_image.name, "lots/previews/aaaa.jpg")
+        self.assertEqual(first.image_width, 2000)
+
+        second.refresh_from_db()
+        self.assertEqual(second.preview_image.name, "lots/previews/new.jpg")
+        self.assertEqual(second.image_hash, "b" * 32)
+        self.assertEqual(len(second.renditions), 1)
+
+        self.assertEqual(Lot.objects.get(pk=unchanged.pk).updated_at, unchanged.updated_at)
+
+
+def title_prefix_search(view, qs, q):
+    return qs.filter(title__startswith="Шатлен ").annotate(rank=Value(1.0, output_field=FloatField()))
+
+
+# триграммный поиск подменён: проверяется переход по страницам нечёткой выдачи, а не сам pg_trgm
+@mock.patch.object(LotListView, "fuzzy_search", title_prefix_search)
+class FuzzySearchPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Lot.objects.bulk_create([Lot(title=f"Шатлен {n}", price=1000 + n) for n in range(15)])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_next_page_by_cursor(self):
+        response = self.client.get(reverse("lots:lot_list"), {"q": "шатлн", "sort": "price_asc"})
+        self.assertTrue(response.context["fuzzy"])
+        self.assertEqual(len(response.context["lots"]), 12)
+
+        cursor = response.context["page_obj"].next_cursor
+        response = self.client.get(reverse("lots:lot_list"), {"q": "шатлн", "sort": "price_asc",
+                                                              "cursor": cursor, "fuzzy": "1"})
+        self.assertTrue(response.context["fuzzy"])
+        self.assertEqual([lot.price for lot in response.context["lots"]], [1012, 1013, 1014])
+
+    def test_next_page_by_number(self):
+        response = self.client.get(reverse("lots:lot_list"), {"q": "шатлн"})
+        self.assertContains(response, "fuzzy=1")
+
+        response = self.client.get(reverse("lots:lot_list"), {"q": "шатлн", "page": "2", "fuzzy": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["lots"]), 3)
+
+    def test_api_next_link(self):
+        response = self.client.get(reverse("lots:api_lot_list"), {"q": "шатлн", "sort": "price_asc"})
+        self.assertTrue(response.json()["fuzzy"])
+        response = self.client.get(response.json()["next"])
+        self.assertEqual([lot["price"] for lot in response.json()["results"]], [1012, 1013, 1014])
+
+
+class FacetCountsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Lot.objects.create(title="Брошь", price=700, category="Броши", tags=["шатлен"],
+                           created_at=now - timedelta(days=1))
+        for n in range(4):
+            Lot.objects.create(title=f"Шатлен {n}", price=3000, category="Шатлены", tags=["шатлен", "цепочка"],
+                               created_at=now + timedelta(minutes=n))
+
+    def shatlen(self):
+        return Lot.objects.filter(is_active=True, tags__contains=["шатлен"]).order_by("-created_at")
+
+    def test_counts(self):
+        facets = facet_counts(self.shatlen())
+        self.assertFalse(facets["approximate"])
+        self.assertEqual(facets["categories"], [("Шатлены", 4), ("Броши", 1)])
+        self.assertEqual(facets["tags"], [("шатлен", 5), ("цепочка", 4)])
+        self.assertEqual(facets["prices"], [(None, 999, 1), (1000, 4999, 4)])
+
+    def test_capped_scan_keeps_every_option(self):
+        with mock.patch("lots.facets.FACET_SCAN_LIMIT", 3):
+            facets = facet_counts(self.shatlen())
+        self.assertTrue(facets["approximate"])
+        # брошь старше трёх просмотренных лотов: вариант есть, числа нет
+        self.assertEqual(facets["categories"][0], ("Шатлены", 3))
+        self.assertIn(("Броши", None), facets["categories"])
+        self.assertIn((None, 999, None), facets["prices"])
+        self.assertIn((1000, 4999, 3), facets["prices"])
+
+
+class ThumbnailViewTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        thumbnails = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(thumbnails.cleanup)
+        self.media = media.name
+        overrides = override_settings(MEDIA_ROOT=media.name, THUMBNAIL_CACHE_ROOT=thumbnails.name,
+                                     THUMBNAIL_ACCEL_REDIRECT=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def write(self, name, content):
+        with open(os.path.join(self.media, name), "wb") as f:
+            f.write(content)
+
+    def jpeg(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 300), "red").save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    def test_builds_thumbnail(self):
+        self.write("ok.jpg", self.jpeg())
+        response = self.client.get(thumbnail_url("ok.jpg", 100, 100))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["X-Accel-Redirect"].endswith(".jpg"))
+
+    def test_unreadable_source_is_not_found(self):
+        self.write("text.jpg", b"not an image")
+        self.write("truncated.jpg", self.jpeg()[:300])
+        for name in ("missing.jpg", "text.jpg", "truncated.jpg"):
+            with self.subTest(name=name):
+                self.assertEqual(self.client.get(thumbnail_url(name, 100, 100)).status_code, 404)
+
+    def test_bad_signature(self):
+        self.write("ok.jpg", self.jpeg())
+        url = thumbnail_url("ok.jpg", 100, 100).replace("100x100", "200x200")
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class LotImporterImagesTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        photos = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(photos.cleanup)
+        self.photos = photos.name
+        overrides = override_settings(MEDIA_ROOT=media.name, REDIS_URL=None)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.photo("main.jpg", "red")
+        self.photo("first.jpg", "green")
+        with open(os.path.join(self.photos, "second.jpg"), "wb") as f:
+            f.write(b"not an image")
+        self.manifest = os.path.join(self.photos, "lots.csv")
+        with open(self.manifest, "w") as f:
+            f.write("sku,title,price,images\nШТЛ-1,Шатлен,1500,main.jpg;first.jpg;second.jpg\n")
+
+    def photo(self, name, color):
+        Image.new("RGB", (600, 400), color).save(os.path.join(self.photos, name), format="JPEG")
+
+    def run_import(self):
+        # то же, что build_images, но без пула процессов: дочерние процессы не видят транзакцию теста
+        importer = LotImporter(self.photos)
+        importer.import_manifest(self.manifest)
+        importer.write_images([process_images(task) for task in importer.image_tasks.values()])
+        with self.captureOnCommitCallbacks() as callbacks:
+            jobs = importer.requeue_failed()
+        return importer.report, jobs, callbacks
+
+    def test_repeat_import_adds_failed_gallery_photo(self):
+        report, _, _ = self.run_import()
+        self.assertEqual((report.images, report.failed_images), (2, 1))
+        lot = Lot.objects.get(external_sku="ШТЛ-1")
+        self.assertEqual(lot.images.count(), 1)
+        preview, renditions = lot.preview_image.name, lot.renditions
+
+        self.photo("second.jpg", "blue")
+        report, _, _ = self.run_import()
+        self.assertEqual((report.images, report.failed_images), (1, 0))
+        lot.refresh_from_db()
+        self.assertEqual(lot.images.count(), 2)
+        # у лота обновлено только updated_at: фото и версии не затёрты
+        self.assertEqual((lot.preview_image.name, lot.renditions), (preview, renditions))
+        self.assertEqual(lot.image_status, ImageStatus.READY)
+
+        report, _, _ = self.run_import()
+        self.assertEqual(report.images, 0)
+        self.assertEqual(lot.images.count(), 2)
+
+    def test_repeat_import_requeues_photo_failed_in_worker(self):
+        self.photo("second.jpg", "blue")
+        self.run_import()
+        lot = Lot.objects.get(external_sku="ШТЛ-1")
+        image = lot.images.order_by("pk").first()
+        LotImage.objects.filter(pk=image.pk).update(image_status=ImageStatus.FAILED)
+
+        report, jobs, callbacks = self.run_import()
+        self.assertEqual(jobs, [{"model": "lots.lotimage", "pk": image.pk, "field": "image", "name": image.image.name}])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(LotImage.objects.get(pk=image.pk).image_status, ImageStatus.PENDING)
+        self.assertEqual(lot.images.count(), 2)
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # равные цены: порядок внутри них задаёт pk
+        Lot.objects.bulk_create([Lot(title=f"Шатлен {n}", price=1000 if n < 4 else 2000, tags=["шатлен"])
+                                 for n in range(7)])
+        cls.lots = Lot.objects.filter(tags__contains=["шатлен"])
+
+    def walk(self, paginator, page):
+        pages = [page]
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            pages.append(page)
+        return pages
+
+    def test_pages_cover_equal_prices_once(self):
+        paginator = KeysetPaginator(self.lots, 3, "price_asc")
+        pages = self.walk(paginator, paginator.page())
+        rows = [lot for page in pages for lot in page]
+        expected = list(self.lots.order_by("price", "pk"))
+        self.assertEqual(rows, expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous())
+
+        # назад от последней страницы — те же страницы
+        page = pages[-1]
+        for expected_page in reversed(pages[:-1]):
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual(list(page), list(expected_page))
+        self.assertFalse(page.has_previous())
+
+    def test_descending_dates(self):
+        paginator = KeysetPaginator(self.lots, 3, "-created_at")
+        rows = [lot for page in self.walk(paginator, paginator.page()) for lot in page]
+        self.assertEqual(rows, list(self.lots.order_by("-created_at", "-pk")))
+
+    def test_cursor_round_trip(self):
+        paginator = KeysetPaginator(self.lots, 3, "-created_at")
+        lot = self.lots.first()
+        self.assertEqual(paginator.decode(paginator.encode(lot, "next")), ("next", lot.created_at, lot.pk))
+
+    def test_foreign_and_tampered_cursors(self):
+        paginator = KeysetPaginator(self.lots, 3, "price_asc")
+        cursor = paginator.page().next_cursor
+        self.assertIsNone(KeysetPaginator(self.lots, 3, "price_desc").decode(cursor))
+        self.assertIsNone(paginator.decode(cursor[:-2] + ("AA" if not cursor.endswith("AA") else "BB")))
+        self.assertIsNone(paginator.decode("мусор"))
+        # испорченный курсор — первая страница
+        self.assertEqual(list(paginator.page("мусор")), list(paginator.page()))
+
+
+class CatalogueFacetsTests(TestCase):
+    def counters(self):
+        return (
+            dict(Category.objects.filter(name="Шатлены").values_list("name", "lot_count")),
+            dict(Tag.objects.filter(name="шатлен").values_list("name", "lot_count")),
+            dict(PriceBucket.objects.values_list("bucket", "lot_count")),
+        )
+
+    def test_counters_follow_lot_changes(self):
+        _, _, buckets = self.counters()
+        lot = Lot.objects.create(title="Шатлен", price=3000, category="шатлены", tags=["Шатлен"])
+        categories, tags, after = self.counters()
+        self.assertEqual(categories, {"Шатлены": 1})
+        self.assertEqual(tags, {"шатлен": 1})
+        self.assertEqual(after.get(1, 0), buckets.get(1, 0) + 1)
+
+        lot.is_active = False
+        lot.save()
+        categories, tags, after = self.counters()
+        self.assertEqual((categories.get("Шатлены", 0), tags.get("шатлен", 0)), (0, 0))
+        self.assertEqual(after.get(1, 0), buckets.get(1, 0))
+
+    def test_catalogue_facets_read_counters(self):
+        Lot.objects.create(title="Шатлен", price=3000, category="Шатлены", tags=["шатлен"])
+        with self.assertNumQueries(3):
+            facets = catalogue_facets()
+        self.assertIn(("Шатлены", 1), facets["categories"])
+        self.assertFalse(facets["approximate"])
+        self.assertEqual(sum(count for _, _, count in facets["prices"]),
+                         Lot.objects.filter(is_active=True).count())
+
+    def test_get_facets(self):
+        Lot.objects.create(title="Шатлен", price=3000, category="Шатлены", tags=["шатлен"])
+        lots = Lot.objects.filter(is_active=True)
+        with self.assertNumQueries(3):
+            get_facets(lots, normalize_filter())
+
+        cache.clear()
+        filters = normalize_filter(tags=["шатлен"])
+        shatlen = lots.filter(tags__contains=["шатлен"]).order_by("-created_at")
+        facets = get_facets(shatlen, filters)
+        self.assertEqual(facets["categories"], [("Шатлены", 1)])
+        # повтор — из кэша до смены версии каталога
+        with self.assertNumQueries(0):
+            self.assertEqual(get_facets(shatlen, filters), facets)
+
+
+class CatalogueCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lot = Lot.objects.create(title="Шатлен", price=3000, category="Шатлены", tags=["шатлен"])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_after_commit(self):
+        version = catalogue_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lot.price = 3500
+            self.lot.save()
+        self.assertGreater(catalogue_version(), version)
+
+    def test_list_page_cached_until_bump(self):
+        url = reverse("lots:lot_list") + "?tag=шатлен"
+        self.assertContains(self.client.get(url), "Шатлен")
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lot.title = "Шатлен серебряный"
+            self.lot.save()
+        self.assertContains(self.client.get(url), "Шатлен серебряный")
+
+    def test_conditional_get(self):
+        url = reverse("lots:lot_detail", args=[self.lot.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        response = self.client.get(url, headers={"if-none-match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lot.price = 3500
+            self.lot.save()
+        response = self.client.get(url, headers={"if-none-match": response["ETag"]})
+        self.assertEqual(response.status_code, 200)
+
+    def test_card_key(self):
+        key = card_key(self.lot)
+        self.assertEqual(card_key(Lot.objects.get(pk=self.lot.pk)), key)
+        self.lot.price = 3500
+        self.lot.save()
+        self.assertNotEqual(card_key(self.lot), key)
+
+    def test_render_cards_reads_cache(self):
+        [html] = render_cards([self.lot])
+        self.assertIn("Шатлен", html)
+        with mock.patch("lots.caching.render_to_string") as render:
+            self.assertEqual(render_cards([self.lot]), [html])
+        render.assert_not_called()
+
+
+class LotApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lot = Lot.objects.create(title="Шатлен", price=3000, category="Шатлены", tags=["шатлен"],
+                                     description="Серебро")
+        Lot.objects.filter(pk=cls.lot.pk).update(
+            main_image="lots/images/a.jpg",
+            preview_image="lots/previews/a.jpg",
+            image_width=1600,
+            image_height=1200,
+            renditions=[
+                {"name": "lots/renditions/a_800.webp", "format": "webp", "width": 800, "height": 600},
+                {"name": "lots/renditions/a_400.webp", "format": "webp", "width": 400, "height": 300},
+                {"name": "lots/renditions/a_400.jpg", "format": "jpeg", "width": 400, "height": 300},
+            ],
+        )
+        LotImage.objects.bulk_create([LotImage(lot=cls.lot, image="lots/gallery/b.jpg"),
+                                      LotImage(lot=cls.lot, image="lots/gallery/c.jpg",
+                                               image_status=ImageStatus.PENDING)])
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, **params):
+        return self.client.get(url, {"tag": "шатлен", **params})
+
+    def test_default_fields(self):
+        [item] = self.get(reverse("lots:api_lot_list")).json()["results"]
+        self.assertEqual(list(item), list(DEFAULT_FIELDS))
+        self.assertEqual(item["url"], reverse("lots:lot_detail", args=[self.lot.pk]))
+        image = item["image"]
+        self.assertTrue(image["url"].endswith("lots/previews/a.jpg"))
+        self.assertEqual((image["width"], image["height"]), (1600, 1200))
+        # версии по форматам, от узкой к широкой
+        self.assertEqual([s["width"] for s in image["sources"]["webp"]], [400, 800])
+        self.assertEqual(len(image["sources"]["jpeg"]), 1)
+
+    def test_selected_fields(self):
+        response = self.get(reverse("lots:api_lot_list"), fields="id,title,images")
+        [item] = response.json()["results"]
+        self.assertEqual(item["id"], self.lot.pk)
+        self.assertEqual(list(item), ["id", "title", "images"])
+        # фото в обработке не отдаётся
+        self.assertEqual(len(item["images"]), 1)
+
+    def test_unknown_field(self):
+        response = self.get(reverse("lots:api_lot_list"), fields="id,secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["error"])
+
+    def test_detail(self):
+        item = self.client.get(reverse("lots:api_lot_detail", args=[self.lot.pk])).json()
+        self.assertEqual(item["description"], "Серебро")
+        self.assertEqual(len(item["images"]), 1)
+        self.assertEqual(self.client.get(reverse("lots:api_lot_detail", args=[0])).status_code, 404)
+
+    def test_list_queries_do_not_grow_with_page(self):
+        Lot.objects.bulk_create([Lot(title=f"Шатлен {n}", price=1000, tags=["шатлен"]) for n in range(10)])
+        with CaptureQueriesContext(connection) as small:
+            self.get(reverse("lots:api_lot_list"), fields="id,images", limit=2, sort="price_asc")
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            self.get(reverse("lots:api_lot_list"), fields="id,images", limit=10, sort="price_asc")
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
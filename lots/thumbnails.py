@@ -0,0 +1,158 @@
+import fcntl
+import hashlib
+import os
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.signing import Signer
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from PIL import Image
+
+from .utils.images import open_image
+
+signer = Signer(salt="lots.thumbnails")
+
+# ограничение на размер, чтобы подписанный URL нельзя было превратить в полноразмерный рендер
+MAX_THUMBNAIL_SIZE = 2560
+
+# сколько файлов-замков: одинаковые ключи всегда попадают в один
+LOCK_STRIPES = 256
+
+
+class SourceUnavailable(Exception):
+    """Исходника нет, или он не декодируется (битый, обрезанный, не изображение)"""
+
+
+def thumbnail_key(name, width, height):
+    return f"{width}x{height}/{name}"
+
+
+def thumbnail_url(name, width, height):
+    """Подписанный URL миниатюры, которая соберётся по первому запросу"""
+    return reverse("lots:thumbnail", kwargs={
+        "signature": signer.signature(thumbnail_key(name, width, height)),
+        "width": width,
+        "height": height,
+        "path": name,
+    })
+
+
+def is_valid(signature, name, width, height):
+    expected = signer.signature(thumbnail_key(name, width, height))
+    return (
+        0 < width <= MAX_THUMBNAIL_SIZE
+        and 0 < height <= MAX_THUMBNAIL_SIZE
+        and ".." not in name.split("/")
+        and constant_time_compare(signature, expected)
+    )
+
+
+def cache_name(name, width, height):
+    """
+    Путь внутри кэша: он же отдаётся nginx через X-Accel-Redirect.
+    Ключ — хэш полного имени исходника с расширением: a.png и a.jpg — разные миниатюры
+    """
+    digest = hashlib.sha256(thumbnail_key(name, width, height).encode()).hexdigest()
+    return f"{width}x{height}/{digest[:2]}/{digest}.jpg"
+
+
+@contextmanager
+def build_lock(key):
+    """
+    Межпроцессный замок на ключ: параллельные промахи по одной миниатюре ждут
+    первого воркера и потом берут готовый файл, а не строят её повторно
+    """
+    lock_dir = os.path.join(settings.THUMBNAIL_CACHE_ROOT, ".locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    stripe = zlib.crc32(key.encode()) % LOCK_STRIPES
+    fd = os.open(os.path.join(lock_dir, f"{stripe}.lock"), os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def get_or_build(name, width, height):
+    """Возвращает имя миниатюры в кэше, собирая её из мастера при промахе"""
+    relative = cache_name(name, width, height)
+    path = os.path.join(settings.THUMBNAIL_CACHE_ROOT, relative)
+
+    if os.path.exists(path):
+        # mtime — время последнего обращения, по нему работает LRU-вытеснение
+        os.utime(path)
+        return relative
+
+    with build_lock(relative):
+        if not os.path.exists(path):
+            build(name, width, height, path)
+            evict()
+    return relative
+
+
+def build(name, width, height, path):
+    try:
+        with default_storage.open(name) as source:
+            img = open_image(source, max(width, height))
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((width, height), Image.Resampling.LANCZOS)
+    except (OSError, Image.DecompressionBombError) as e:
+        # UnidentifiedImageError и «image file is truncated» — тоже OSError;
+        # ошибки записи в кэш ниже сюда не попадают и остаются ошибками сервера
+        raise SourceUnavailable(name) from e
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # запись во временный файл и атомарная замена: nginx не увидит недописанный файл
+    tmp = f"{path}.{os.getpid()}.tmp"
+    img.save(tmp, format="JPEG", quality=80, optimize=True)
+    os.replace(tmp, path)
+
+
+def evict():
+    """
+    LRU-вытеснение по mtime, когда кэш превысил THUMBNAIL_CACHE_MAX_MB.
+    Обход каталога запускается не чаще раза в минуту и только после сборки новой миниатюры
+    """
+    root = settings.THUMBNAIL_CACHE_ROOT
+    marker = os.path.join(root, ".locks", "evict")
+    try:
+        if time.time() - os.path.getmtime(marker) < 60:
+            return
+    except FileNotFoundError:
+        pass
+    with open(marker, "w"):
+        pass
+
+    files = []
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != ".locks"]
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    limit = settings.THUMBNAIL_CACHE_MAX_MB * 1024 * 1024
+    if total <= limit:
+        return
+
+    # освобождаем с запасом, чтобы не обходить каталог на каждом промахе
+    target = limit * 0.9
+    for _, size, path in sorted(files):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
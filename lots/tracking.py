@@ -0,0 +1,119 @@
+import copy
+from collections import defaultdict
+
+from django.db.models import FileField
+from django.db.models.fields.files import FieldFile
+
+
+def comparable(field, value):
+    # файл сравнивается по имени
+    if isinstance(field, FileField):
+        return (value.name if isinstance(value, FieldFile) else value) or ""
+    return value
+
+
+def bulk_update_changed(model, rows):
+    """
+    rows — пары (pk, {поле: значение}). bulk_update пишет один список полей во все строки,
+    поэтому строки группируются по набору своих полей: поля, которых у строки нет,
+    не затираются значениями по умолчанию
+    """
+    groups = defaultdict(list)
+    for pk, values in rows:
+        if values:
+            groups[frozenset(values)].append(model(pk=pk, **values))
+    for fields, objs in groups.items():
+        model.objects.bulk_update(objs, sorted(fields))
+
+
+class ChangeTrackingMixin:
+    """
+    Значения полей на момент загрузки из БД: что изменилось, видно без запроса к БД.
+    save() без update_fields пишет только изменённые столбцы (и поля auto_now), а если
+    ничего не изменилось — не пишет ничего. Ставится перед models.Model в списке базовых классов
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded()
+        return instance
+
+    def __getstate__(self):
+        # copy.copy() и pickle копируют __dict__ поверхностно: без своей копии снимка
+        # save() копии переписал бы снимок оригинала
+        state = super().__getstate__()
+        if "_loaded_values" in state:
+            state["_loaded_values"] = dict(state["_loaded_values"])
+        return state
+
+    @property
+    def _loaded(self):
+        return self.__dict__.setdefault("_loaded_values", {})
+
+    def remember_loaded(self, names=None):
+        """Запоминает текущие значения как записанные в БД; names=None — все загруженные поля"""
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__ and (names is None or not {field.name, field.attname}.isdisjoint(names)):
+                # копия: правка списка на месте (tags.append) тоже должна быть видна как изменение
+                self._loaded[field.attname] = copy.deepcopy(comparable(field, self.__dict__[field.attname]))
+
+    def loaded_values(self, *names):
+        """
+        Значения полей, как они были в БД (у файлов — имя). Поле, которое не загружалось
+        вместе с объектом (only/defer), а сразу было присвоено, догружается запросом
+        """
+        fields = [self._meta.get_field(name) for name in names]
+        missing = [f for f in fields if f.attname not in self._loaded]
+        if missing and not self._state.adding:
+            row = type(self)._base_manager.filter(pk=self.pk).values(*(f.attname for f in missing)).first() or {}
+            for field in missing:
+                if field.attname in row:
+                    self._loaded[field.attname] = comparable(field, row[field.attname])
+        return {field.name: self._loaded.get(field.attname) for field in fields}
+
+    def previous(self, *names):
+        """Несохранённая копия с прежними значениями полей names; None для нового объекта"""
+        if self._state.adding:
+            return None
+        values = self.loaded_values(*names)
+        return type(self)(**{self._meta.get_field(name).attname: value for name, value in values.items()})
+
+    @property
+    def dirty_fields(self):
+        """Имена изменённых полей; у нового объекта — все поля"""
+        if self._state.adding:
+            return {f.name for f in self._meta.concrete_fields}
+
+        return {f.name for f in self._meta.concrete_fields if self.field_changed(f)}
+
+    def has_changed(self, name):
+        return self._state.adding or self.field_changed(self._meta.get_field(name))
+
+    def field_changed(self, field):
+        # незагруженные (deferred) поля не изменены: Django их и не запишет
+        if field.attname not in self.__dict__:
+            return False
+        value = self.__dict__[field.attname]
+        if field.attname not in self._loaded or (isinstance(value, FieldFile) and not value._committed):
+            return True
+        return comparable(field, value) != self._loaded[field.attname]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get("update_fields") is None \
+                and not kwargs.get("force_insert"):
+            update_fields = self.dirty_fields - {self._meta.pk.name}
+            if update_fields:
+                # поля auto_now обновляются при каждой записи
+                update_fields |= {f.name for f in self._meta.concrete_fields if getattr(f, "auto_now", False)}
+            # пустой update_fields: Django ничего не пишет и сигналов не шлёт
+            kwargs["update_fields"] = update_fields
+
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        self.remember_loaded(None if update_fields is None else set(update_fields))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        # в том числе догрузка отложенного поля при первом обращении к нему
+        self.remember_loaded(None if fields is None else set(fields))
@@ -1,9 +1,17 @@
 from django.urls import path
-from .views import LotListView, LotDetailView
+from .api import LotDetailApiView, LotListApiView
+from .feeds import SitemapView, YmlFeedView
+from .views import LotListView, LotDetailView, ThumbnailView
 
 app_name = "lots"
 
 urlpatterns = [
     path("", LotListView.as_view(), name="lot_list"),
     path("<int:pk>/", LotDetailView.as_view(), name="lot_detail"),
+    path("api/lots/", LotListApiView.as_view(), name="api_lot_list"),
+    path("api/lots/<int:pk>/", LotDetailApiView.as_view(), name="api_lot_detail"),
+    path("sitemap.xml", SitemapView.as_view(), name="sitemap"),
+    path("sitemap-<int:page>.xml", SitemapView.as_view(), name="sitemap_page"),
+    path("feed/yml.xml", YmlFeedView.as_view(), name="yml_feed"),
+    path("img/<str:signature>/<int:width>x<int:height>/<path:path>", ThumbnailView.as_view(), name="thumbnail"),
 ]
\ No newline at end of file
@@ -1,56 +1,357 @@
+import hashlib
 import os
+import re
+from dataclasses import dataclass
 from io import BytesIO
-from PIL import Image
+from PIL import Image, features
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from pillow_heif import register_heif_opener
 
 register_heif_opener()
 
-def process_image(image_field, size=1920, quality=88):
+EXTENSIONS = {
+    "JPEG": "jpg",
+    "WEBP": "webp",
+    "AVIF": "avif",
+}
+
+HASHED_NAME_RE = re.compile(r"([0-9a-f]{32})_\d+q\d+\.\w+$")
+
+# метаданные изображения, которые хранятся в моделях рядом с файлами
+META_FIELDS = ["image_width", "image_height", "image_bytes", "image_color"]
+
+MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+
+
+@dataclass(frozen=True)
+class Rendition:
     """
-    Универсальная обработка изображения:
-    - Поддерживает форматы: HEIC, JPEG, PNG
-    - Конвертирует всё в качественный JPEG
-    - Делает ресайз до указанного размера 'size' по длинной стороне
-    - Оптимизирует размер файла
+    Одна версия изображения:
+    - size: ограничение по длинной стороне
+    - field: ImageField модели, куда записывается результат;
+      все версии (и с полем, и без) перечисляются в JSON-поле 'renditions'
     """
-    try:
-        img = Image.open(image_field)
+    size: int
+    format: str = "JPEG"
+    quality: int = 85
+    field: str = None
+
+    @property
+    def extension(self):
+        return EXTENSIONS[self.format]
+
+    @property
+    def available(self):
+        # AVIF/WebP зависят от того, с какими кодеками собран Pillow
+        return self.format == "JPEG" or features.check(self.format.lower())
 
-        # конвертация в RGB
-        if img.mode != "RGB":
-            img = img.convert("RGB")
 
-        # ресайз с использованием LANCZOS
-        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+class RenditionSet:
+    """Набор версий, который модель объявляет для своего ImageField"""
 
-        buffer = BytesIO()
+    def __init__(self, *renditions, upload_to=""):
+        self.renditions = renditions
+        self.upload_to = upload_to
+
+    def __iter__(self):
+        # от большей версии к меньшей: каждая следующая уменьшается из предыдущей
+        renditions = [r for r in self.renditions if r.available]
+        return iter(sorted(renditions, key=lambda r: (-r.size, r.format)))
+
+
+def encode(img, rendition):
+    buffer = BytesIO()
+    if rendition.format == "JPEG":
         # optimize=True подбирает оптимальную таблицу сжатия
-        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+        img.save(buffer, format="JPEG", quality=rendition.quality, optimize=True)
+    else:
+        img.save(buffer, format=rendition.format, quality=rendition.quality)
+    return ContentFile(buffer.getvalue())
+
+
+def dominant_color(img):
+    """Средний цвет кадра в виде '#rrggbb' — заглушка, пока грузится фото"""
+    r, g, b = img.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+class ImageTooLarge(ValueError):
+    """Исходник не укладывается в лимиты по пикселям или памяти"""
+
 
-        return ContentFile(buffer.getvalue())
-    except Exception as e:
-        # логирование ошибки, если файл битый или формат не поддерживается
-        print(f"Ошибка при обработке изображения: {e}")
-        return None
+def check_pixels(img):
+    """Проверка по заголовку, до декодирования пикселей"""
+    width, height = img.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(
+            f"Слишком большое изображение: {width}x{height}, "
+            f"допустимо не больше {settings.IMAGE_MAX_PIXELS // 1_000_000} Мпикс"
+        )
 
 
-def compress_and_save_pair(instance, image_field, preview_field, base_size=2560, thumb_size=800):
+def check_memory(img):
+    """Оценка памяти под декодированный кадр в том масштабе, который реально будет декодирован"""
+    width, height = img.size
+    decoded_mb = width * height * max(len(img.getbands()), 3) / 1024 / 1024
+    if decoded_mb > settings.IMAGE_MAX_DECODE_MB:
+        raise ImageTooLarge(
+            f"Изображение {width}x{height} потребует ~{decoded_mb:.0f} МБ при декодировании, "
+            f"лимит {settings.IMAGE_MAX_DECODE_MB} МБ"
+        )
+
+
+def open_image(source, max_size):
     """
-    Универсальный обработчик для любой пары 'Оригинал + Превью'
+    Открывает исходник так, чтобы декодировать как можно меньше пикселей:
+    JPEG сразу декодируется в уменьшенном масштабе (draft, 1/2..1/8),
+    остальные форматы после загрузки ужимаются быстрым reduce
     """
-    if not image_field:
+    img = Image.open(source)
+    check_pixels(img)
+
+    if img.format == "JPEG":
+        img.draft("RGB", (max_size, max_size))
+    check_memory(img)
+
+    img.load()
+    factor = max(img.size) // max_size
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+
+def validate_image_budget(file):
+    """Валидатор ImageField: отклоняет загрузку по заголовку ещё в форме админки"""
+    if getattr(file, "_committed", False):
+        # уже сохранённый файл проверен при загрузке, хранилище не трогаем
         return
+    try:
+        file.seek(0)
+        check_pixels(Image.open(file))
+    except ImageTooLarge as e:
+        raise ValidationError(str(e))
+    finally:
+        file.seek(0)
+
+
+def render(source, renditions, existing=()):
+    """
+    Строит все версии из набора за одно декодирование исходника.
+    Поддерживает HEIC, JPEG, PNG. Возвращает список (rendition, ContentFile, (width, height))
+    и основной цвет, посчитанный по самой маленькой версии.
+    Версия, которая не уменьшила бы исходник, пропускается: в формате остаётся одна версия
+    в размер исходника. existing — (формат, размер) уже сохранённых версий
+    """
+    renditions = list(renditions)
+    img = open_image(source, max(r.size for r in renditions))
+
+    # конвертация в RGB
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    result = []
+    produced = set(existing)
+    for rendition in renditions:
+        # ресайз с использованием LANCZOS из предыдущей (ближайшей большей) версии,
+        # поэтому копия полноразмерного кадра в памяти не нужна
+        if max(img.size) > rendition.size:
+            img.thumbnail((rendition.size, rendition.size), Image.Resampling.LANCZOS)
+        # исходник меньше версии: тот же размер в этом формате уже есть, второй файл дал бы дубль в srcset
+        if (rendition.format, img.size) in produced:
+            continue
+        produced.add((rendition.format, img.size))
+        result.append((rendition, encode(img, rendition), img.size))
+
+    return result, dominant_color(img)
+
 
-    filename = os.path.basename(image_field.name)
-    base_name = os.path.splitext(filename)[0]
+def file_hash(source):
+    """sha256 содержимого (первые 32 символа) — ключ для адресации по содержимому"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(1024 * 1024), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()[:32]
 
-    # создаем превью 800px
-    thumb_data = process_image(image_field, size=thumb_size, quality=75)
-    if thumb_data:
-        preview_field.save(f"{base_name}_thumb.jpg", thumb_data, save=False)
 
-    # создаем качественный оригинал 2560px
-    main_data = process_image(image_field, size=base_size, quality=90)
-    if main_data:
-        image_field.save(f"{base_name}.jpg", main_data, save=False)
\ No newline at end of file
+def hashed_name(content_hash, rendition):
+    """
+    Имя версии зависит только от содержимого исходника и параметров версии,
+    поэтому одинаковые загрузки ссылаются на одни и те же файлы, а сами файлы не меняются
+    """
+    return f"{content_hash[:2]}/{content_hash}_{rendition.size}q{rendition.quality}.{rendition.extension}"
+
+
+def plan_names(instance, source_field, renditions, content_hash):
+    rendition_set = instance.RENDITIONS[source_field]
+    names = {}
+    for rendition in renditions:
+        relative = hashed_name(content_hash, rendition)
+        if rendition.field:
+            # upload_to поля сохраняется: lots/images/, lots/previews/ и т.д.
+            field = instance._meta.get_field(rendition.field)
+            names[rendition] = field.generate_filename(instance, relative)
+        else:
+            names[rendition] = os.path.join(rendition_set.upload_to, relative)
+    return names
+
+
+def find_donor(instance, source_field, content_hash, planned):
+    """Строка с тем же исходником, у которой уже есть все версии нужного набора"""
+    model = type(instance)
+    candidates = (
+        model.objects.filter(image_hash=content_hash, image_status="ready")
+        .only(source_field, "preview_image", "renditions", *META_FIELDS)
+    )
+    for donor in candidates:
+        if all(has_rendition(donor.renditions or [], rendition, name) for rendition, name in planned.items()):
+            return donor
+    return None
+
+
+def has_rendition(items, rendition, name):
+    # версии, которые не уменьшили бы исходник, не строятся (см. render)
+    if any(item["name"] == name for item in items):
+        return True
+    widest = [max(item["width"], item["height"]) for item in items if item["format"] == rendition.format.lower()]
+    return bool(widest) and max(widest) <= rendition.size
+
+
+def save_renditions(instance, source_field, rebuild_source=True):
+    """
+    Пересобирает версии для source_field по набору instance.RENDITIONS[source_field].
+    Файлы пишутся в хранилище, поля модели обновляются без сохранения в БД.
+    rebuild_source=False оставляет уже сжатый оригинал как есть и строит из него только производные.
+    У моделей с полем image_hash имена файлов строятся по содержимому: повторная загрузка того же фото
+    берёт готовые версии у другой строки без декодирования. Возвращает список изменённых полей
+    """
+    rendition_set = instance.RENDITIONS[source_field]
+    image_field = getattr(instance, source_field)
+    if not image_field:
+        return []
+
+    renditions = [r for r in rendition_set if rebuild_source or r.field != source_field]
+    content_addressed = hasattr(instance, "image_hash")
+    base_name = os.path.splitext(os.path.basename(image_field.name))[0]
+    storage = image_field.storage
+    changed = []
+
+    # исходник читается до того, как поле с оригиналом будет перезаписано
+    with image_field.open("rb") as source:
+        planned = {}
+        if content_addressed:
+            content_hash = (not rebuild_source and instance.image_hash) or file_hash(source)
+            planned = plan_names(instance, source_field, renditions, content_hash)
+            instance.image_hash = content_hash
+            changed.append("image_hash")
+
+            donor = find_donor(instance, source_field, content_hash, planned)
+            if donor is not None:
+                for rendition in rendition_set:
+                    if rendition.field and (rebuild_source or rendition.field != source_field):
+                        setattr(instance, rendition.field, getattr(donor, rendition.field).name)
+                        changed.append(rendition.field)
+                for name in ["renditions", *META_FIELDS]:
+                    setattr(instance, name, getattr(donor, name))
+                return changed + ["renditions", *META_FIELDS]
+
+        source_size = Image.open(source).size
+        source.seek(0)
+        master = next(r for r in rendition_set if r.field == source_field)
+        existing = () if rebuild_source else [(master.format, source_size)]
+        outputs, color = render(source, renditions, existing)
+
+    if not rebuild_source:
+        # оригинал не перекодируется, но в списке версий и метаданных он нужен
+        outputs.insert(0, (master, None, source_size))
+
+    built = {rendition for rendition, _, _ in outputs}
+    for rendition in renditions:
+        if rendition.field and rendition not in built and getattr(instance, rendition.field):
+            # маленький исходник: превью не строится, вместо него показывается оригинал
+            setattr(instance, rendition.field, None)
+            changed.append(rendition.field)
+
+    extra = []
+    for rendition, content, (width, height) in outputs:
+        if rendition.field == source_field and hasattr(instance, "image_width"):
+            # размеры храним в БД, чтобы страницы не открывали файл ради заголовка
+            instance.image_width, instance.image_height = width, height
+            instance.image_bytes = content.size if content else image_field.size
+            instance.image_color = color
+            changed += META_FIELDS
+
+        name = planned.get(rendition)
+        if content is None:
+            name = image_field.name
+        elif name and storage.exists(name):
+            # такой файл уже построен из того же исходника — перезаписывать незачем
+            if rendition.field:
+                setattr(instance, rendition.field, name)
+                changed.append(rendition.field)
+        elif rendition.field:
+            suffix = "" if rendition.field == source_field else f"_{rendition.size}"
+            field_file = getattr(instance, rendition.field)
+            if name:
+                field_file.name = storage.save(name, content)
+            else:
+                field_file.save(f"{base_name}{suffix}.{rendition.extension}", content, save=False)
+            name = field_file.name
+            changed.append(rendition.field)
+        else:
+            name = storage.save(
+                name or os.path.join(rendition_set.upload_to, f"{base_name}_{rendition.size}.{rendition.extension}"),
+                content,
+            )
+
+        # полный список версий нужен для srcset без обращений к хранилищу
+        extra.append({
+            "name": name,
+            "format": rendition.format.lower(),
+            "size": rendition.size,
+            "width": width,
+            "height": height,
+            "field": rendition.field,
+        })
+
+    if hasattr(instance, "renditions"):
+        instance.renditions = extra
+        changed.append("renditions")
+
+    return changed
+
+
+def rendition_names(instance, source_field):
+    """Все файлы, относящиеся к изображению source_field, включая доп. версии"""
+    names = set()
+    for rendition in instance.RENDITIONS[source_field]:
+        if rendition.field:
+            names.add(getattr(instance, rendition.field).name)
+    names.add(getattr(instance, source_field).name)
+    for item in getattr(instance, "renditions", None) or []:
+        names.add(item["name"])
+    names.discard(None)
+    names.discard("")
+    return names
+
+
+def release_files(model, source_field, names):
+    """
+    Удаляет файлы, на которые больше не ссылается ни одна строка модели.
+    Файлы с адресацией по содержимому могут быть общими у нескольких лотов
+    """
+    hashes = {m.group(1) for m in map(HASHED_NAME_RE.search, names) if m}
+    referenced = set()
+    if hashes:
+        for row in model.objects.filter(image_hash__in=hashes).only(source_field, "preview_image", "renditions"):
+            referenced |= rendition_names(row, source_field)
+
+    storage = model._meta.get_field(source_field).storage
+    for name in set(names) - referenced:
+        storage.delete(name)
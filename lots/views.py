@@ -1,38 +1,127 @@
-from django.db.models import Q
+import os
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity, TrigramWordSimilarity
+from django.db.models import F, Q
+from django.http import FileResponse, Http404, HttpResponse
+from django.views import View
 from django.views.generic import ListView, DetailView
-from .models import Lot
+from .caching import CatalogueCacheMixin, ConditionalGetMixin, catalogue_modified, catalogue_version, render_cards
+from .facets import get_facets, normalize_filter
+from .models import Lot, Tag
+from .pagination import KEYSET_ORDERINGS, KeysetPaginator
+from .thumbnails import SourceUnavailable, get_or_build, is_valid
+from .utils.images import HASHED_NAME_RE, ImageTooLarge
+
+
+def suggest(q):
+    """Ближайший по написанию тег из словаря для «Возможно, вы имели в виду» (индекс tag_name_trgm)"""
+    suggestion = (
+        Tag.objects.filter(name__trigram_similar=q, lot_count__gt=0)
+        .annotate(similarity=TrigramSimilarity("name", q))
+        .order_by("-similarity")
+        .values_list("name", flat=True)
+        .first()
+    )
+    if suggestion and suggestion != q.lower():
+        return suggestion
+    return None
 
 
-class LotListView(ListView):
+class LotListView(ConditionalGetMixin, CatalogueCacheMixin, ListView):
     model = Lot
     template_name = "lot_list.html"
     context_object_name = "lots"
     paginate_by = 12
+    # заполняются в paginate_queryset, если точный поиск ничего не нашёл
+    fuzzy = False
+    suggestion = None
 
-    def get_queryset(self):
-        qs = super().get_queryset().filter(is_active=True)
+    def get_etag(self, request, *args, **kwargs):
+        # любая правка каталога меняет версию; разные ?q=/?sort= — разные URL со своей копией
+        version = catalogue_version()
+        return f"list-{version}" if version is not None else None
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return catalogue_modified()
+
+    def get_sort(self):
+        # при поиске по умолчанию сначала самые релевантные
+        q = self.request.GET.get("q", "").strip()
+        return self.request.GET.get("sort") or ("relevance" if q else "-created_at")
+
+    def get_tags(self, param):
+        return [t.strip().lower() for t in self.request.GET.getlist(param) if t.strip()]
+
+    def get_price(self, param):
+        # некорректная граница цены просто не учитывается
+        try:
+            value = int(self.request.GET.get(param, ""))
+        except ValueError:
+            return None
+        return value if value >= 0 else None
+
+    def get_filters(self):
+        # всё, что определяет набор лотов (но не порядок и страницу), — ключ кэша фасетов
+        return {
+            **normalize_filter(
+                q=self.request.GET.get("q", ""),
+                tags=self.get_tags("tag"),
+                any_tags=self.get_tags("any_tag"),
+                category=self.request.GET.get("category", ""),
+                min_price=self.get_price("min_price"),
+                max_price=self.get_price("max_price"),
+            ),
+            "fuzzy": self.fuzzy,
+        }
+
+    def get_facets(self):
+        """Счётчики по текущему фильтру; для тегов — набор tag= после клика (добавить или снять тег)"""
+        facets = get_facets(self.object_list, self.get_filters())
+        selected = self.get_tags("tag")
+        tags = []
+        for name, count in facets["tags"]:
+            active = name in selected
+            link = [t for t in selected if t != name] if active else [*selected, name]
+            tags.append((name, count, active, link))
+        price = (self.get_price("min_price"), self.get_price("max_price"))
+        prices = [(low, high, count, (low, high) == price) for low, high, count in facets["prices"]]
+        return {**facets, "tags": tags, "prices": prices}
+
+    def get_queryset(self, fuzzy=False):
+        # search_vector нужен только в WHERE, в выборку его не тянем
+        qs = super().get_queryset().filter(is_active=True).defer("search_vector")
 
         # параметры фильтрации из GET-запроса
         q = self.request.GET.get("q", "").strip()
-        tag = self.request.GET.get("tag", "").strip().lower()
+        tags = self.get_tags("tag")
+        any_tags = self.get_tags("any_tag")
         category = self.request.GET.get("category", "").strip()
-        sort = self.request.GET.get("sort", "-created_at")
+        min_price = self.get_price("min_price")
+        max_price = self.get_price("max_price")
+        sort = self.get_sort()
 
-        # фильтры
-        if q:
-            qs = qs.filter(
-                Q(title__icontains=q) |
-                Q(description__icontains=q) |
-                Q(tags__icontains=q)
-            )
+        # фильтры: ?tag=a&tag=b — все теги сразу (@>), ?any_tag=a&any_tag=b — любой из них (&&),
+        # оба обслуживаются GIN-индексом lot_tags_gin
+        if tags:
+            qs = qs.filter(tags__contains=tags)
 
-        if tag:
-            # поиск тега содержался в CSV
-            qs = qs.filter(tags__icontains=tag)
+        if any_tags:
+            qs = qs.filter(tags__overlap=any_tags)
 
         if category:
             qs = qs.filter(category__iexact=category)
 
+        # диапазон цены (границы включительно) — по индексу lot_active_price_idx
+        if min_price is not None:
+            qs = qs.filter(price__gte=min_price)
+
+        if max_price is not None:
+            qs = qs.filter(price__lte=max_price)
+
+        if q:
+            qs = self.fuzzy_search(qs, q) if fuzzy else self.search(qs, q)
+
         # логика сортировки
         if sort == "price_asc":
             qs = qs.order_by("price")
@@ -40,27 +129,134 @@ class LotListView(ListView):
             qs = qs.order_by("-price")
         elif sort == "oldest":
             qs = qs.order_by("created_at")
+        elif sort == "relevance" and q:
+            qs = qs.order_by("-rank", "-created_at", "-pk")
         else:
             qs = qs.order_by("-created_at")
         return qs
 
+    def search(self, qs, q):
+        # полнотекстовый поиск по search_vector (GIN-индекс), морфология русского языка
+        query = SearchQuery(q, config="russian", search_type="websearch")
+        return qs.filter(search_vector=query).annotate(rank=SearchRank(F("search_vector"), query))
+
+    def fuzzy_search(self, qs, q):
+        # похожие названия по триграммам: оператор %> обслуживается GIN-индексом lot_title_trgm
+        self.suggestion = suggest(q)
+        similar = Q(title__trigram_word_similar=q)
+        if self.suggestion:
+            # и лоты с подсказанным тегом — через тот же полнотекстовый индекс
+            similar |= Q(search_vector=SearchQuery(self.suggestion, config="russian"))
+        return qs.filter(similar).annotate(rank=TrigramWordSimilarity(q, "title"))
+
+    def paginate_queryset(self, queryset, page_size):
+        q = self.request.GET.get("q", "").strip()
+        # следующие страницы нечёткой выдачи: ссылки на них несут ?fuzzy=1,
+        # иначе там снова выполнился бы точный поиск и страница оказалась бы пустой
+        if q and self.request.GET.get("fuzzy") == "1":
+            self.fuzzy = True
+            self.object_list = self.get_queryset(fuzzy=True)
+            return self.paginate(self.object_list, page_size)
+
+        result = self.paginate(queryset, page_size)
+
+        # пустая первая страница точного поиска — вероятно, опечатка.
+        # отдельная проверка exists() не нужна: первая страница всё равно запрашивается,
+        # а LIMIT 1 по редкому слову планировщик выполняет полным перебором таблицы
+        first_page = not self.request.GET.get("cursor") and self.request.GET.get("page", "1") == "1"
+        if q and first_page and not result[2]:
+            self.fuzzy = True
+            self.object_list = self.get_queryset(fuzzy=True)
+            result = self.paginate(self.object_list, page_size)
+        return result
+
+    def paginate(self, queryset, page_size):
+        sort = self.get_sort()
+        if sort not in KEYSET_ORDERINGS:
+            # у релевантности нет стабильного ключа — обычные номера страниц
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, sort)
+        page = paginator.page(self.request.GET.get("cursor"))
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         # добавляем параметры фильтрации в контекст
         context["q"] = self.request.GET.get("q", "").strip()
-        context["selected_tag"] = self.request.GET.get("tag", "").strip()
+        context["selected_tags"] = self.get_tags("tag")
+        context["selected_tag"] = next(iter(context["selected_tags"]), "")
         context["selected_category"] = self.request.GET.get("category", "").strip()
-        context["current_sort"] = self.request.GET.get("sort", "-created_at")
+        context["min_price"] = self.get_price("min_price")
+        context["max_price"] = self.get_price("max_price")
+        context["current_sort"] = self.get_sort()
+
+        # результаты нечёткого поиска и подсказка «Возможно, вы имели в виду»
+        context["fuzzy"] = self.fuzzy
+        context["fuzzy_param"] = "1" if self.fuzzy else None
+        context["suggestion"] = self.suggestion
+
+        context["cards"] = render_cards(list(context["page_obj"]))
+
+        # фасеты считаются по тому же набору, что и список (после возможного перехода к нечёткому поиску)
+        context["facets"] = self.get_facets()
 
         return context
 
 
-class LotDetailView(DetailView):
+class LotDetailView(ConditionalGetMixin, CatalogueCacheMixin, DetailView):
     model = Lot
     template_name = "lots/lot_detail.html"
     context_object_name = "lot"
 
+    def get_updated_at(self, pk):
+        # один лёгкий запрос по первичному ключу; None — лота нет, ответом будет 404
+        if not hasattr(self, "_updated_at"):
+            self._updated_at = Lot.objects.filter(pk=pk, is_active=True).values_list("updated_at", flat=True).first()
+        return self._updated_at
+
+    def get_etag(self, request, *args, **kwargs):
+        updated_at = self.get_updated_at(kwargs["pk"])
+        if updated_at is None:
+            return None
+        # версия каталога учитывает и выкладку новых шаблонов (сбрасывается после migrate)
+        return f"lot-{kwargs['pk']}-{updated_at.timestamp()}-{catalogue_version()}"
+
+    def get_last_modified(self, request, *args, **kwargs):
+        # updated_at лота меняется и при правке его галереи
+        return self.get_updated_at(kwargs["pk"])
+
     def get_queryset(self):
         # фильтр по активным лотам
-        return super().get_queryset().filter(is_active=True).prefetch_related("images")
+        return super().get_queryset().filter(is_active=True).defer("search_vector").prefetch_related("images")
+
+
+class ThumbnailView(View):
+    """
+    Миниатюра произвольного размера по подписанному URL /img/<подпись>/<w>x<h>/<путь>.
+    При промахе собирается из оригинала один раз, дальше берётся из кэша на диске
+    """
+
+    def get(self, request, signature, width, height, path):
+        if not is_valid(signature, path, width, height):
+            raise Http404
+        try:
+            name = get_or_build(path, width, height)
+        except (SourceUnavailable, ImageTooLarge):
+            raise Http404
+
+        if settings.THUMBNAIL_ACCEL_REDIRECT:
+            response = HttpResponse(content_type="image/jpeg")
+            response["X-Accel-Redirect"] = settings.THUMBNAIL_CACHE_URL + name
+        else:
+            response = FileResponse(
+                open(os.path.join(settings.THUMBNAIL_CACHE_ROOT, name), "rb"), content_type="image/jpeg"
+            )
+
+        # оригинал с адресацией по содержимому не меняется, значит и миниатюра тоже
+        if HASHED_NAME_RE.search(path):
+            response["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response["Cache-Control"] = "public, max-age=86400"
+        return response
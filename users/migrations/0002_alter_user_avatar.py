@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import lots.utils.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="user",
+            name="avatar",
+            field=models.ImageField(
+                blank=True,
+                help_text="Загрузите свой аватар",
+                null=True,
+                upload_to="users/avatars/",
+                validators=[lots.utils.images.validate_image_budget],
+            ),
+        ),
+    ]
@@ -2,6 +2,10 @@ from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from lots.tasks import schedule_renditions
+from lots.tracking import ChangeTrackingMixin
+from lots.utils.images import Rendition, RenditionSet, validate_image_budget
+
 
 class CustomUserManager(BaseUserManager):
     """Кастомный менеджер для модели пользователя с поддержкой email и username"""
@@ -39,7 +43,7 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(email, username, password, **extra_fields)
 
 
-class User(AbstractUser):
+class User(ChangeTrackingMixin, AbstractUser):
     """
     Кастомная модель пользователя с авторизацией по email ИЛИ username
     """
@@ -74,7 +78,8 @@ class User(AbstractUser):
         upload_to="users/avatars/",
         blank=True,
         null=True,
-        help_text="Загрузите свой аватар"
+        help_text="Загрузите свой аватар",
+        validators=[validate_image_budget],
     )
 
     token = models.CharField(
@@ -90,6 +95,11 @@ class User(AbstractUser):
     # USERNAME_FIELD динамический
     REQUIRED_FIELDS = []  # Для createsuperuser команды
 
+    # аватар ужимается фоновым воркером, как и фото лотов
+    RENDITIONS = {
+        "avatar": RenditionSet(Rendition(512, quality=85, field="avatar")),
+    }
+
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
@@ -108,6 +118,15 @@ class User(AbstractUser):
             raise ValidationError(_('Должен быть указан либо email, либо username'))
 
     def save(self, *args, **kwargs):
-        """Переопределяем save для валидации"""
+        """Переопределяем save для валидации и обработки аватара"""
         self.clean()
-        super().save(*args, **kwargs)
\ No newline at end of file
+
+        update_fields = kwargs.get("update_fields")
+        # сравнение с аватаром, загруженным вместе с пользователем, — без запроса к БД
+        is_new_avatar = bool(self.avatar) and (update_fields is None or "avatar" in update_fields) \
+            and self.has_changed("avatar")
+
+        super().save(*args, **kwargs)
+
+        if is_new_avatar:
+            schedule_renditions(self, "avatar")
\ No newline at end of file